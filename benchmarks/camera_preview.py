@@ -0,0 +1,151 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the camera preview backends.
+
+Each backend runs in a fresh process, showing the preview in a window.
+Reports the time from process start to the first frame, the resident memory
+once streaming, and the CPU time used per displayed frame, at the full rate
+and at the rate used while the dialog is not focused.
+
+The Clutter backend always opens the camera through Cheese. The GTK backend
+uses --source, so it can be measured without a camera with videotestsrc.
+--window sets the size of the preview window, the GTK backend scales its
+frames down to it.
+
+    python3 benchmarks/camera_preview.py [--seconds 5] [--window 400]
+        [--source videotestsrc]
+"""
+
+import time
+
+STARTED = time.perf_counter()
+
+import argparse  # nopep8
+import json  # nopep8
+import os  # nopep8
+import subprocess  # nopep8
+import sys  # nopep8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKENDS = ['gtk', 'clutter']
+
+
+def get_rss():
+    """Return the resident memory of this process in MiB."""
+    with open('/proc/self/status') as status:
+        for line in status:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024.0
+    return 0.0
+
+
+def run_backend(backend, source, seconds, size):
+    """Show the preview with backend and print the measurements as JSON."""
+    import gi
+    gi.require_version('Gst', '1.0')
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import GLib, Gst, Gtk
+
+    Gst.init(None)
+    from mugshot import CameraBox
+    if backend == 'clutter':
+        from mugshot.ClutterCameraBox import ClutterCameraBox
+        camera = ClutterCameraBox(None)
+    else:
+        camera = CameraBox.GtkSinkCameraBox(None, source=source)
+
+    window = Gtk.Window()
+    window.set_default_size(size, size)
+    window.add(camera)
+    window.show_all()
+    camera.play()
+
+    result = {'backend': backend, 'frames': {}, 'cpu_per_frame': {}}
+    rates = [None, CameraBox.unfocused_rate]
+
+    def on_first_frame():
+        if camera.frames.frame_count == 0:
+            return True
+        result['first_frame'] = time.perf_counter() - STARTED
+        result['rss'] = get_rss()
+        start_rate()
+        return False
+
+    def start_rate():
+        camera.set_preview_rate(rates[0])
+        camera.get_cpu_per_frame()
+        result['start'] = camera.frames.frame_count
+        GLib.timeout_add(int(seconds * 1000), on_rate_done)
+
+    def on_rate_done():
+        rate = str(rates.pop(0) or 'full')
+        result['frames'][rate] = camera.frames.frame_count - result['start']
+        result['cpu_per_frame'][rate] = camera.get_cpu_per_frame()
+        result['rss'] = max(result['rss'], get_rss())
+        if rates:
+            start_rate()
+        else:
+            camera.stop()
+            Gtk.main_quit()
+        return False
+
+    GLib.timeout_add(5, on_first_frame)
+    Gtk.main()
+    print(json.dumps(result))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--source", default='v4l2src')
+    parser.add_argument("--window", type=int, default=400)
+    parser.add_argument("--backend", choices=BACKENDS, action='append')
+    parser.add_argument("--child", choices=BACKENDS, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.child:
+        run_backend(options.child, options.source, options.seconds,
+                    options.window)
+        return 0
+
+    print("%-8s %14s %8s %6s %8s %14s" % ("backend", "first frame ms",
+                                          "RSS MiB", "rate", "frames",
+                                          "CPU ms/frame"))
+    for backend in options.backend or BACKENDS:
+        process = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", backend,
+             "--source", options.source, "--seconds", str(options.seconds),
+             "--window", str(options.window)],
+            stdout=subprocess.PIPE, universal_newlines=True)
+        if process.returncode != 0 or not process.stdout.strip():
+            print("%-8s %14s" % (backend, "unavailable"))
+            continue
+        result = json.loads(process.stdout.strip().splitlines()[-1])
+        for rate in sorted(result['frames'], reverse=True):
+            per_frame = result['cpu_per_frame'][rate]
+            print("%-8s %14.1f %8.1f %6s %8i %14s" % (
+                backend, result['first_frame'] * 1000, result['rss'], rate,
+                result['frames'][rate],
+                "-" if per_frame is None else "%.2f" % (per_frame * 1000)))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the ~/.face output formats.
+
+Reports encode time, decode time and size for each codec setting, for the
+images produced by the camera, browse and stock paths. Use the results to
+choose the avatar-format, png-compression, jpeg-quality and webp-quality
+settings in org.bluesabre.mugshot.
+
+    python3 benchmarks/encoders.py [--max-size 512] [--runs 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib  # nopep8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mugshot_lib import pixbufs  # nopep8
+
+faces_dir = '/usr/share/pixmaps/faces/'
+
+
+def make_photo(width, height):
+    """Return a photo-like pixbuf of the requested size."""
+    noise = GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(os.urandom(48 * 32 * 3)),
+        GdkPixbuf.Colorspace.RGB, False, 8, 48, 32, 48 * 3)
+    return noise.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+
+
+def get_stock_face():
+    """Return an installed stock face, or a synthetic one."""
+    if os.path.isdir(faces_dir):
+        for filename in sorted(os.listdir(faces_dir)):
+            try:
+                return GdkPixbuf.Pixbuf.new_from_file(
+                    os.path.join(faces_dir, filename))
+            except GLib.Error:
+                continue
+    return make_photo(96, 96)
+
+
+def get_sources(max_size):
+    """Return the (name, pixbuf) images saved by each path."""
+    normalizer = pixbufs.AvatarNormalizer(max_size)
+    # The camera crops a square from a 1280x720 frame.
+    camera = make_photo(1280, 720).new_subpixbuf(280, 0, 720, 720)
+    # Browsing crops a square from a 12 MP photo.
+    browse = make_photo(4242, 2828).new_subpixbuf(707, 0, 2828, 2828)
+    return [('camera', normalizer.normalize(camera)),
+            ('browse', normalizer.normalize(browse)),
+            ('stock', get_stock_face())]
+
+
+def get_codecs():
+    """Return the (format, options) combinations to benchmark."""
+    writable = pixbufs.get_writable_formats()
+    codecs = [('png', {'compression': level}) for level in [0, 1, 6, 9]]
+    codecs += [('jpeg', {'quality': quality}) for quality in [75, 85, 95]]
+    if 'webp' in writable:
+        codecs += [('webp', {'quality': quality}) for quality in [75, 90]]
+    return codecs
+
+
+def benchmark(pixbuf, image_format, options, runs):
+    """Return (encode seconds, decode seconds, bytes) for a codec."""
+    keys = list(options.keys())
+    values = [str(options[key]) for key in keys]
+    encode = []
+    decode = []
+    for run in range(runs):
+        start = time.perf_counter()
+        success, data = pixbuf.save_to_bufferv(image_format, keys, values)
+        encode.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        loader = GdkPixbuf.PixbufLoader()
+        loader.write(data)
+        loader.close()
+        loader.get_pixbuf()
+        decode.append(time.perf_counter() - start)
+    return (min(encode), min(decode), len(data))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--max-size", type=int, default=512,
+                        help="Value of the avatar-max-size setting")
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+
+    print("%-7s %-9s %-16s %10s %10s %10s" % ("path", "size", "codec",
+                                             "encode ms", "decode ms",
+                                             "KiB"))
+    for name, pixbuf in get_sources(options.max_size):
+        size = "%ix%i" % (pixbuf.get_width(), pixbuf.get_height())
+        for image_format, codec_options in get_codecs():
+            codec = "%s %s" % (image_format,
+                               " ".join("%s=%s" % item
+                                        for item in codec_options.items()))
+            encode, decode, length = benchmark(pixbuf, image_format,
+                                               codec_options, options.runs)
+            print("%-7s %-9s %-16s %10.2f %10.2f %10.1f" % (
+                name, size, codec, encode * 1000, decode * 1000,
+                length / 1024.0))
+
+
+if __name__ == "__main__":
+    main()
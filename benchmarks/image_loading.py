@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark loading a profile image preview (128x128).
+
+Compares the full decode followed by a HYPER scale with the decode-at-size
+loader in mugshot_lib.pixbufs, for 1, 12 and 50 megapixel JPEG inputs. Each
+measurement runs in a fresh process so that the peak RSS is meaningful.
+
+    python3 benchmarks/image_loading.py [--sizes 1 12 50] [--runs 3]
+"""
+
+import argparse
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib  # nopep8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TARGET = 128
+
+
+def make_jpeg(filename, megapixels):
+    """Write a photo-like JPEG of the requested size to filename."""
+    width = int(math.sqrt(megapixels * 1000000 * 1.5))
+    height = int(width / 1.5)
+    # Upscaled noise compresses (and decodes) much like a real photograph.
+    noise = GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(os.urandom(48 * 32 * 3)),
+        GdkPixbuf.Colorspace.RGB, False, 8, 48, 32, 48 * 3)
+    image = noise.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+    image.savev(filename, "jpeg", ["quality"], ["90"])
+
+
+def load_full(filename):
+    """The original loading path: full decode, then HYPER."""
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file(filename)
+    return pixbuf.scale_simple(TARGET, TARGET, GdkPixbuf.InterpType.HYPER)
+
+
+def load_at_size(filename):
+    """The decode-at-size loading path."""
+    from mugshot_lib import pixbufs
+    return pixbufs.load_scaled(filename, TARGET, TARGET)
+
+
+def measure(method, filename):
+    """Run a single measurement in this process, print seconds and KiB."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    {'full': load_full, 'at-size': load_at_size}[method](filename)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - before
+    print("%f %i" % (elapsed, peak))
+
+
+def run_measurement(method, filename):
+    """Measure in a child process, return (seconds, peak KiB)."""
+    output = subprocess.check_output([sys.executable, __file__, '--measure',
+                                      method, filename])
+    elapsed, peak = output.decode('utf-8').split()
+    return (float(elapsed), int(peak))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 12, 50],
+                        help="Input sizes in megapixels")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--measure", nargs=2, help=argparse.SUPPRESS)
+    options = parser.parse_args()
+
+    if options.measure:
+        measure(*options.measure)
+        return
+
+    print("%6s  %-8s  %10s  %12s" % ("MP", "method", "seconds", "peak MiB"))
+    with tempfile.TemporaryDirectory() as directory:
+        for megapixels in options.sizes:
+            filename = os.path.join(directory, "%g.jpg" % megapixels)
+            make_jpeg(filename, megapixels)
+            for method in ['full', 'at-size']:
+                results = [run_measurement(method, filename)
+                           for run in range(options.runs)]
+                elapsed = min(result[0] for result in results)
+                peak = min(result[1] for result in results) / 1024.0
+                print("%6g  %-8s  %10.3f  %12.1f" % (megapixels, method,
+                                                     elapsed, peak))
+
+
+if __name__ == "__main__":
+    main()
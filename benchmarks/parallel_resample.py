@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the strip-parallel downscalers across cores.
+
+Downscales a large panorama to the default avatar size with 1, 2, 4, ...
+worker threads, with the NumPy resampler and with GdkPixbuf HYPER strips.
+Reports the time, the speedup over one worker, and whether the output is
+identical to the single-threaded result.
+
+    python3 benchmarks/parallel_resample.py [--megapixels 50] [--runs 3]
+"""
+
+import argparse
+import math
+import os
+import sys
+import time
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib  # nopep8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mugshot_lib import imaging, pixbufs  # nopep8
+
+TARGET = 512
+
+
+def make_panorama(megapixels):
+    """Return a photo-like 3:1 pixbuf of the requested size."""
+    height = int(math.sqrt(megapixels * 1000000 / 3.0))
+    noise = GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(os.urandom(96 * 32 * 3)),
+        GdkPixbuf.Colorspace.RGB, False, 8, 96, 32, 96 * 3)
+    return noise.scale_simple(height * 3, height,
+                              GdkPixbuf.InterpType.BILINEAR)
+
+
+def get_worker_counts():
+    """Return 1, 2, 4, ... up to the number of CPUs."""
+    counts = [1]
+    while counts[-1] * 2 <= (os.cpu_count() or 1):
+        counts.append(counts[-1] * 2)
+    if counts[-1] != (os.cpu_count() or 1):
+        counts.append(os.cpu_count())
+    return counts
+
+
+def time_best(function, runs):
+    """Return the fastest of runs calls to function, and its result."""
+    best = None
+    for run in range(runs):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return (best, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--megapixels", type=float, default=50)
+    parser.add_argument("--runs", type=int, default=3)
+    options = parser.parse_args()
+
+    source = make_panorama(options.megapixels)
+    width = TARGET
+    height = max(1, TARGET * source.get_height() // source.get_width())
+    print("Scaling %ix%i to %ix%i" % (source.get_width(),
+                                      source.get_height(), width, height))
+
+    scalers = [('hyper', lambda workers: pixbufs.scale_strips(
+        source, width, height, workers))]
+    if imaging.has_numpy():
+        array = pixbufs.pixbuf_to_array(source)
+        for method in [imaging.METHOD_BOX, imaging.METHOD_LANCZOS]:
+            scalers.append((method, lambda workers, method=method:
+                            pixbufs.array_to_pixbuf(imaging.resample(
+                                array, width, height, method, workers))))
+
+    print("%-8s %8s %10s %8s %10s" % ("method", "workers", "ms", "speedup",
+                                      "identical"))
+    for name, scaler in scalers:
+        single = None
+        reference = None
+        for workers in get_worker_counts():
+            elapsed, result = time_best(lambda: scaler(workers),
+                                        options.runs)
+            pixels = result.read_pixel_bytes().get_data()
+            if single is None:
+                single = elapsed
+                reference = pixels
+            print("%-8s %8i %10.1f %8.2f %10s" % (
+                name, workers, elapsed * 1000, single / elapsed,
+                pixels == reference))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
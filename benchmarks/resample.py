@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark the NumPy resamplers against GdkPixbuf HYPER scaling.
+
+Scales the square crops used by the camera, browse and stock paths to the
+sizes Mugshot saves and displays, and reports the time of each method and
+its mean absolute difference from HYPER (0-255).
+
+    python3 benchmarks/resample.py [--runs 5]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import gi
+gi.require_version('GdkPixbuf', '2.0')
+from gi.repository import GdkPixbuf, GLib  # nopep8
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mugshot_lib import imaging, pixbufs  # nopep8
+
+# (name, source width, source height, target size)
+cases = [('stock', 180, 180, 90),
+         ('preview', 1024, 1024, 128),
+         ('camera', 1280, 720, 512),
+         ('browse', 4242, 2828, 512)]
+
+
+def make_photo(width, height):
+    """Return a photo-like pixbuf of the requested size."""
+    noise = GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(os.urandom(48 * 32 * 3)),
+        GdkPixbuf.Colorspace.RGB, False, 8, 48, 32, 48 * 3)
+    return noise.scale_simple(width, height, GdkPixbuf.InterpType.BILINEAR)
+
+
+def time_best(function, runs):
+    """Return the fastest of runs calls to function, and its result."""
+    best = None
+    for run in range(runs):
+        start = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return (best, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--runs", type=int, default=5)
+    options = parser.parse_args()
+
+    if not imaging.has_numpy():
+        print("NumPy is not installed.")
+        return 1
+
+    print("%-8s %-11s %-8s %10s %10s" % ("path", "source", "method", "ms",
+                                         "diff"))
+    for name, width, height, size in cases:
+        source = pixbufs.crop_square(make_photo(width, height))
+        source_size = "%ix%i" % (width, height)
+
+        elapsed, hyper = time_best(lambda: source.scale_simple(
+            size, size, GdkPixbuf.InterpType.HYPER), options.runs)
+        reference = pixbufs.pixbuf_to_array(hyper).astype(float)
+        print("%-8s %-11s %-8s %10.2f %10s" % (name, source_size, "hyper",
+                                               elapsed * 1000, "-"))
+
+        array = pixbufs.pixbuf_to_array(source)
+        for method in [imaging.METHOD_BOX, imaging.METHOD_LANCZOS]:
+            elapsed, result = time_best(lambda: imaging.resample(
+                array, size, size, method), options.runs)
+            difference = abs(result.astype(float) - reference).mean()
+            print("%-8s %-11s %-8s %10.2f %10.2f" % (
+                name, source_size, method, elapsed * 1000, difference))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,679 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Camera preview widgets.
+
+Two preview backends are available: GtkSinkCameraBox, a plain Gtk.Box
+showing a GStreamer gtkglsink or gtksink, and ClutterCameraBox (in its own
+module so Clutter and Cheese are only loaded when it is used), which embeds
+a Clutter stage driven by Cheese. Use create_camera_box() to get the best
+available one.'''
+
+import logging
+import resource
+import threading
+
+import gi
+gi.require_version('Gst', '1.0')
+
+from gi.repository import GdkPixbuf, GLib, Gtk, GObject, Gst  # nopep8
+
+from mugshot_lib import FrameRing, capture, pixbufs  # nopep8
+
+logger = logging.getLogger('mugshot')
+
+# Size of the preview emitted as soon as a photo is taken.
+preview_size = 128
+
+# Seconds the camera stays paused, with the device open, before it is
+# released: after a photo is taken, and once the dialog is hidden.
+paused_release_timeout = 60
+hidden_release_timeout = 5
+
+# Frames per second shown while the camera dialog is not focused.
+unfocused_rate = 10
+
+# Milliseconds to wait for the preview size to settle before changing it.
+preview_resize_delay = 200
+
+# GTK video sinks, in order of preference.
+gtk_sinks = ['gtkglsink', 'gtksink']
+
+
+def get_gtk_sinks():
+    """Return the GTK video sinks that are installed."""
+    found = []
+    for name in gtk_sinks:
+        if Gst.ElementFactory.find(name) is None:
+            continue
+        if name == 'gtkglsink' and \
+                Gst.ElementFactory.find('glsinkbin') is None:
+            continue
+        found.append(name)
+    return found
+
+
+def make_gtk_sink(name):
+    """Return (element, widget) for the GTK video sink name, or None."""
+    sink = Gst.ElementFactory.make(name, None)
+    if sink is None:
+        return None
+    widget = sink.get_property("widget")
+    if name == 'gtkglsink':
+        # gtkglsink only accepts GL memory, glsinkbin uploads the frames.
+        element = Gst.ElementFactory.make('glsinkbin', None)
+        if element is None:
+            return None
+        element.set_property("sink", sink)
+        return (element, widget)
+    return (sink, widget)
+
+
+def get_cpu_time():
+    """Return the CPU seconds used by this process."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def time_since(start):
+    """Return the seconds since start, a GLib monotonic time."""
+    return (GLib.get_monotonic_time() - start) / 1000000.0
+
+
+class DeviceProbe:
+
+    '''
+    Lists the video devices and their formats in a worker thread, as every
+    device is opened to read its formats, so the GTK preview does not have
+    to do it on the main thread.
+    '''
+
+    def __init__(self):
+        """Initialize the DeviceProbe."""
+        self._devices = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start listing the devices, unless that is already in progress."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        """List the devices. Called from the worker thread."""
+        started = GLib.get_monotonic_time()
+        devices = capture.get_video_devices()
+        logger.debug('Found %i camera(s) in %.3fs' % (len(devices),
+                                                      time_since(started)))
+        with self._lock:
+            self._devices = devices
+            self._thread = None
+
+    def get_devices(self):
+        """Return the (node, formats) of the video devices, as listed by
+        capture.get_video_devices(). A running probe is waited for, and the
+        devices are listed now if there was none. Each result is only used
+        once, as devices come and go."""
+        with self._lock:
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        with self._lock:
+            devices = self._devices
+            self._devices = None
+        if devices is None:
+            devices = capture.get_video_devices()
+        return devices
+
+
+# Shared by the camera dialogs, which are created at most once.
+device_probe = DeviceProbe()
+
+
+def create_camera_box(parent, size=512, burst=1, backend='auto',
+                      device=None):
+    """Return a camera preview widget. backend is 'gtk', 'clutter' or 'auto'
+    (GTK if a GTK video sink is installed, Clutter otherwise). The other
+    backend is used if the requested one is unavailable. device is the node
+    of the preferred camera, used if it is connected."""
+    sinks = get_gtk_sinks()
+    if backend != 'clutter' and sinks:
+        logger.debug('Using the %s camera preview' % sinks[0])
+        return GtkSinkCameraBox(parent, size, burst, sinks=sinks,
+                                device=device)
+    try:
+        from mugshot.ClutterCameraBox import ClutterCameraBox
+    except (ImportError, ValueError):
+        if not sinks:
+            raise
+        return GtkSinkCameraBox(parent, size, burst, sinks=sinks,
+                                device=device)
+    logger.debug('Using the Clutter camera preview')
+    return ClutterCameraBox(parent, size, burst, device)
+
+
+class CameraBoxBase:
+
+    '''
+    Photo capture and power state handling shared by the preview backends.
+
+    The camera starts released: nothing is opened until play() or
+    prepare() is called.
+
+    Subclasses are GTK widgets which set __gsignals__ to (a copy of)
+    CameraBoxBase.signals, call init_camera() when constructed and override
+    get_pipeline(). The default start_streaming() and stop_streaming() move
+    that pipeline between PLAYING and NULL, and capture_frame() cannot take
+    a photo without a buffered frame; backends with their own device handling
+    override them. They can also override get_rate_element() to support
+    set_preview_rate().
+    '''
+    signals = {
+        'photo-preview': (GObject.SIGNAL_RUN_LAST,
+                          GObject.TYPE_NONE,
+                          (GObject.TYPE_PYOBJECT,)),
+        'photo-ready': (GObject.SIGNAL_RUN_LAST,
+                        GObject.TYPE_NONE,
+                        (GObject.TYPE_PYOBJECT,)),
+        'gst-state-changed': (GObject.SIGNAL_RUN_LAST,
+                              GObject.TYPE_NONE,
+                              (GObject.TYPE_INT,))
+    }
+
+    def init_camera(self, parent, size, burst):
+        """Initialize the state shared by the backends."""
+        self.state = Gst.State.NULL
+        self.parent = parent
+        # Side of the square photos, the preview uses the same stream.
+        self.size = size
+        self.power = capture.StateTimer(capture.RELEASED)
+        self._release_id = None
+        # Node of the device being shown, or None if unknown.
+        self.device = None
+
+        # Recent frames, so photos match the moment Record was clicked.
+        self.burst = burst
+        self.frames = FrameRing.FrameRing(max(burst, 2))
+
+        self._generation = 0
+        self._cpu_sample = (get_cpu_time(), 0)
+        # Frames per second the preview is limited to, None for full rate.
+        self.preview_rate = None
+
+    def get_pipeline(self):
+        """Return the preview pipeline, or None."""
+        return None
+
+    def start_streaming(self):
+        """Open the device and start streaming."""
+        pipeline = self.get_pipeline()
+        if pipeline is not None:
+            pipeline.set_state(Gst.State.PLAYING)
+
+    def stop_streaming(self):
+        """Stop streaming and close the device."""
+        pipeline = self.get_pipeline()
+        if pipeline is not None:
+            pipeline.set_state(Gst.State.NULL)
+
+    def capture_frame(self):
+        """Request a new frame, delivered to on_photo_taken(). Used when no
+        frame has been buffered. Return False if that is not possible."""
+        logger.debug('No camera frame to take a photo from yet.')
+        return False
+
+    def get_rate_element(self):
+        """Return the videorate element limiting the preview rate, or
+        None."""
+        return None
+
+    def set_preview_rate(self, rate=None):
+        """Limit the preview to rate frames per second, or restore the full
+        rate of the camera if rate is None."""
+        self.preview_rate = rate
+        element = self.get_rate_element()
+        if element is None:
+            return
+        max_rate = rate or GLib.MAXINT32
+        if element.get_property("max-rate") != max_rate:
+            logger.debug('Camera preview rate: %s' % (rate or 'full'))
+            element.set_property("max-rate", max_rate)
+
+    def get_cpu_per_frame(self):
+        """Return the CPU seconds used by the process per camera frame since
+        the last call, or None if no frames arrived."""
+        cpu = get_cpu_time()
+        frames = self.frames.frame_count
+        last_cpu, last_frames = self._cpu_sample
+        self._cpu_sample = (cpu, frames)
+        if frames == last_frames:
+            return None
+        return (cpu - last_cpu) / (frames - last_frames)
+
+    def play(self):
+        """Start streaming. A paused pipeline is resumed as it is, the device
+        is only reopened if it was released."""
+        self._cancel_release()
+        if self.power.state == capture.PLAYING:
+            return
+        # The frozen frames are older than anything that will be shown.
+        self.frames.clear()
+        pipeline = self.get_pipeline()
+        if self.power.state == capture.PAUSED and pipeline is not None:
+            pipeline.set_state(Gst.State.PLAYING)
+        else:
+            self.start_streaming()
+        self.power.set_state(capture.PLAYING)
+
+    def prepare(self, release_timeout=paused_release_timeout):
+        """Open the device without streaming, so play() starts quickly. The
+        device is released if play() is not called within release_timeout
+        seconds."""
+        if self.power.state != capture.RELEASED:
+            return
+        pipeline = self.get_pipeline()
+        if pipeline is None:
+            return
+        pipeline.set_state(Gst.State.PAUSED)
+        self.power.set_state(capture.PAUSED)
+        self._cancel_release()
+        self._release_id = GLib.timeout_add_seconds(release_timeout,
+                                                    self._on_release_timeout)
+
+    def pause(self, release_timeout=paused_release_timeout):
+        """Freeze the preview on the last frame, keeping the device open for
+        a quick resume. The device is released if the camera is still paused
+        after release_timeout seconds."""
+        if self.power.state == capture.RELEASED:
+            return
+        if self.power.state == capture.PLAYING:
+            pipeline = self.get_pipeline()
+            if pipeline is None:
+                self.release()
+                return
+            pipeline.set_state(Gst.State.PAUSED)
+            self.power.set_state(capture.PAUSED)
+        self._cancel_release()
+        self._release_id = GLib.timeout_add_seconds(release_timeout,
+                                                    self._on_release_timeout)
+
+    def release(self):
+        """Stop streaming and close the device."""
+        self._cancel_release()
+        if self.power.state == capture.RELEASED:
+            return
+        self.stop_streaming()
+        self.power.set_state(capture.RELEASED)
+
+    def _cancel_release(self):
+        """Cancel a pending release."""
+        if self._release_id is not None:
+            GLib.source_remove(self._release_id)
+            self._release_id = None
+
+    def _on_release_timeout(self):
+        """Release the device after staying paused."""
+        self._release_id = None
+        logger.debug('Releasing the idle camera.')
+        self.release()
+        return False
+
+    def stop(self):
+        self.frames.detach()
+        self.release()
+        logger.debug('Camera time in each state: %s' %
+                     self.power.get_summary())
+
+    def take_photo(self):
+        """Take a photo from the frame on screen when this was called, or
+        the sharpest of the last burst frames. A new frame is only requested
+        if none has been buffered. photo-ready is emitted with the photo as
+        a pixbufs.AvatarImage."""
+        clicked = self.frames.clock()
+        self.set_preview_rate(None)
+        self._generation += 1
+        pixbuf = self.frames.get_pixbuf(clicked, self.burst)
+        if pixbuf is None:
+            return self.capture_frame()
+        GLib.idle_add(self._on_buffered_photo, pixbuf)
+        return True
+
+    def _on_buffered_photo(self, pixbuf):
+        """Process a buffered frame like a newly captured one."""
+        self.on_photo_taken(None, pixbuf)
+        return False
+
+    def on_photo_taken(self, camera, pixbuf):
+        """Emit a small preview of the photo straight away, then scale it in
+        a worker thread so the preview does not freeze."""
+        # Crop a balanced center, without copying the frame.
+        new_pixbuf = pixbufs.crop_square(pixbuf)
+        self.emit("photo-preview", new_pixbuf.scale_simple(
+            preview_size, preview_size, GdkPixbuf.InterpType.BILINEAR))
+
+        worker = threading.Thread(target=self._prepare_photo,
+                                  args=(new_pixbuf, self._generation),
+                                  daemon=True)
+        worker.start()
+
+    def _prepare_photo(self, pixbuf, generation):
+        """Scale the cropped photo down to the photo size. Called from a
+        worker thread. The photo is encoded once it is saved."""
+        image = pixbufs.AvatarImage.new_from_pixbuf(
+            pixbuf, pixbufs.AvatarNormalizer(self.size))
+        GLib.idle_add(self._on_photo_ready, image, generation)
+
+    def _on_photo_ready(self, image, generation):
+        """Emit photo-ready on the main thread, unless another photo has been
+        taken since."""
+        if generation == self._generation:
+            self.emit("photo-ready", image)
+        return False
+
+
+class GtkSinkCameraBox(CameraBoxBase, Gtk.Box):
+
+    '''
+    Camera preview shown by a GStreamer GTK video sink, without Clutter or
+    Cheese. The camera is opened in the cheapest format covering the photo
+    size, and the frames are cropped to a square and scaled down to the
+    photo size in the pipeline.
+
+    If the pipeline fails before showing a frame (e.g. no OpenGL for
+    gtkglsink), the next sink is tried. preview-failed is emitted when none
+    work.
+
+    With the default v4l2src source, cameras are watched with a
+    Gst.DeviceMonitor: the pipeline is rebuilt for a newly plugged camera if
+    there was none or it is the preferred device, and for another camera if
+    the one in use is removed.
+
+    Keyword arguments:
+    - parent: The camera dialog.
+    - size:   Side of the square photos.
+    - burst:  Number of frames to pick the sharpest photo from.
+    - source: GStreamer source element description.
+    - sinks:  Names of the GTK video sinks to try, in order.
+    - device: Node of the preferred camera, used if it is connected. Only
+              used with the default v4l2src source.
+    '''
+    __gsignals__ = dict(CameraBoxBase.signals)
+    __gsignals__['preview-failed'] = (GObject.SIGNAL_RUN_LAST,
+                                      GObject.TYPE_NONE, ())
+
+    def __init__(self, parent, size=512, burst=1, source='v4l2src',
+                 sinks=None, device=None):
+        Gtk.Box.__init__(self)
+        self.init_camera(parent, size, burst)
+        # Size to capture at, and side of the square frames it gives.
+        self.frame = None
+        self.frame_side = size
+        self.source = source
+        self.preferred_device = device
+        # Formats of the connected cameras, by device node.
+        self.devices = {}
+        self.device_monitor = None
+        # Whether the camera was playing when its device failed.
+        self._interrupted = False
+        if source == 'v4l2src':
+            # List every device once, then open only the one chosen, in the
+            # cheapest format covering the photo size.
+            self.devices = dict(device_probe.get_devices())
+            self.select_device(capture.choose_device(list(self.devices),
+                                                     device))
+            self.start_device_monitor()
+        if sinks is None:
+            sinks = get_gtk_sinks()
+        self.sinks = list(sinks)
+        self.sink_name = None
+        self.pipeline = None
+        self.rate = None
+        self.preview_caps = None
+        self.widget = None
+        self.first_frame_time = None
+        self._started = None
+        self._resize_id = None
+        self.connect("size-allocate", self.on_size_allocate)
+
+        # Nothing is streamed until play() or prepare() is called.
+        if not self.build_pipeline():
+            GLib.idle_add(self.emit, "preview-failed")
+
+    def select_device(self, node):
+        """Capture from the device node (the default device if None) in the
+        cheapest format covering the photo size."""
+        self.device = node
+        self.source = 'v4l2src'
+        self.frame = None
+        self.frame_side = self.size
+        if node is not None:
+            self.source = 'v4l2src device=%s' % node
+            self.frame = capture.choose_format(self.devices.get(node, []),
+                                               self.size)
+        if self.frame is not None:
+            logger.debug('Using camera format %ix%i' % self.frame)
+            self.frame_side = capture.get_output_size(
+                self.frame[0], self.frame[1], self.size)
+
+    def start_device_monitor(self):
+        """Watch for cameras being plugged in or removed. Starting the
+        monitor probes the devices, so it is done in a worker thread."""
+        self.device_monitor = Gst.DeviceMonitor.new()
+        self.device_monitor.add_filter("Video/Source", None)
+        self.device_monitor.get_bus().add_watch(GLib.PRIORITY_DEFAULT,
+                                                self.on_device_message)
+        worker = threading.Thread(target=self.device_monitor.start,
+                                  daemon=True)
+        worker.start()
+
+    def stop_device_monitor(self):
+        """Stop watching the cameras."""
+        if self.device_monitor is not None:
+            self.device_monitor.get_bus().remove_watch()
+            self.device_monitor.stop()
+            self.device_monitor = None
+
+    def on_device_message(self, bus, message):
+        """Follow cameras being plugged in or removed."""
+        if message.type == Gst.MessageType.DEVICE_ADDED:
+            device = message.parse_device_added()
+            node = capture.get_device_node(device)
+            if node is None or node in self.devices:
+                return True
+            logger.debug('Camera device added: %s' % node)
+            self.devices[node] = capture.get_caps_formats(device.get_caps())
+            if self.device is None or node == self.preferred_device:
+                self.switch_device(node)
+        elif message.type == Gst.MessageType.DEVICE_REMOVED:
+            node = capture.get_device_node(message.parse_device_removed())
+            if node is None or node not in self.devices:
+                return True
+            logger.debug('Camera device removed: %s' % node)
+            del self.devices[node]
+            if node == self.device:
+                self.switch_device(capture.choose_device(
+                    list(self.devices), self.preferred_device))
+        return True
+
+    def switch_device(self, node):
+        """Rebuild the pipeline for the device node, or remove it if node is
+        None, keeping the camera playing or paused as it was."""
+        logger.debug('Switching to camera device %s' % node)
+        state = self.power.state
+        if self._interrupted:
+            state = capture.PLAYING
+            self._interrupted = False
+        self.release()
+        if node is None:
+            # Wait for a camera to be plugged in.
+            self.destroy_pipeline()
+            self.device = None
+            return
+        self.select_device(node)
+        # Keep the sink that worked.
+        if self.sink_name is not None:
+            self.sinks.insert(0, self.sink_name)
+        self.first_frame_time = None
+        if not self.build_pipeline():
+            self.emit("preview-failed")
+            return
+        # The frame side depends on the format of the device.
+        self._on_resize_timeout()
+        if state == capture.PLAYING:
+            self.play()
+        elif state == capture.PAUSED:
+            self.prepare()
+
+    def build_pipeline(self):
+        """Build the preview pipeline with the next available sink. Return
+        False if there are none left."""
+        self.destroy_pipeline()
+        while self.sinks:
+            self.sink_name = self.sinks.pop(0)
+            made = make_gtk_sink(self.sink_name)
+            if made is not None:
+                break
+        else:
+            return False
+        sink, self.widget = made
+
+        try:
+            source = Gst.parse_bin_from_description(
+                capture.get_preview_pipeline(self.source, self.size,
+                                             self.frame), True)
+        except GLib.Error as error:  # pylint: disable=E0712
+            logger.debug('Unable to create the camera pipeline: %s' %
+                         error.message)
+            return False
+        self.pipeline = Gst.Pipeline.new("mugshot-camera")
+        self.pipeline.add(source)
+        self.pipeline.add(sink)
+        source.link(sink)
+
+        # Buffer the full size frames before the preview rate limit, the
+        # preview may be scaled down and slowed down.
+        self.rate = source.get_by_name("rate")
+        self.preview_caps = source.get_by_name("preview")
+        self.frames.attach(self.rate.get_static_pad("sink"))
+        pad = sink.get_static_pad("sink")
+        pad.add_probe(Gst.PadProbeType.BUFFER, self._on_first_frame)
+
+        bus = self.pipeline.get_bus()
+        bus.add_signal_watch()
+        bus.connect("message::error", self.on_bus_error)
+        bus.connect("message::state-changed", self.on_bus_state_changed)
+
+        self.pack_start(self.widget, True, True, 0)
+        self.widget.show()
+        return True
+
+    def get_rate_element(self):
+        if self.pipeline is None:
+            return None
+        return self.rate
+
+    def set_preview_side(self, side):
+        """Scale the frames sent to the sink to side x side."""
+        if self.pipeline is None:
+            return
+        caps = Gst.Caps.from_string("video/x-raw,width=%i,height=%i" %
+                                    (side, side))
+        current = self.preview_caps.get_property("caps")
+        if current is None or not caps.is_equal(current):
+            logger.debug('Camera preview size: %ix%i' % (side, side))
+            self.preview_caps.set_property("caps", caps)
+
+    def on_size_allocate(self, widget, allocation):
+        """Follow the size of the widget once it settles."""
+        if self._resize_id is not None:
+            GLib.source_remove(self._resize_id)
+        self._resize_id = GLib.timeout_add(preview_resize_delay,
+                                           self._on_resize_timeout)
+
+    def _on_resize_timeout(self):
+        """Scale the preview to the size of the widget."""
+        self._resize_id = None
+        allocation = self.get_allocation()
+        self.set_preview_side(capture.get_preview_side(
+            allocation.width, allocation.height, self.frame_side,
+            self.get_scale_factor()))
+        return False
+
+    def destroy_pipeline(self):
+        """Stop and remove the current pipeline and sink widget."""
+        if self.pipeline is not None:
+            self.frames.detach()
+            self.pipeline.set_state(Gst.State.NULL)
+            self.pipeline.get_bus().remove_signal_watch()
+            self.pipeline = None
+        if self.widget is not None:
+            self.remove(self.widget)
+            self.widget = None
+
+    def _on_first_frame(self, pad, info):
+        """Record when the first frame reached the sink."""
+        if self._started is not None:
+            self.first_frame_time = time_since(self._started)
+            logger.debug('First camera frame after %.3fs' %
+                         self.first_frame_time)
+        return Gst.PadProbeReturn.REMOVE
+
+    def on_bus_error(self, bus, message):
+        """Fall back to the next sink if the pipeline fails to start."""
+        error, debug = message.parse_error()
+        logger.debug('Camera pipeline error (%s): %s' % (self.sink_name,
+                                                         error.message))
+        if self.first_frame_time is not None:
+            # e.g. the camera was unplugged, resume on the next one.
+            self._interrupted = self.power.state == capture.PLAYING
+            self.release()
+            return
+        if self.build_pipeline():
+            if self.power.state == capture.PLAYING:
+                self.start_streaming()
+            elif self.power.state == capture.PAUSED:
+                self.pipeline.set_state(Gst.State.PAUSED)
+        else:
+            self.power.set_state(capture.RELEASED)
+            self.emit("preview-failed")
+
+    def on_bus_state_changed(self, bus, message):
+        """Emit gst-state-changed when the pipeline changes state."""
+        if message.src != self.pipeline:
+            return
+        old, new, pending = message.parse_state_changed()
+        self.state = new
+        self.emit("gst-state-changed", new)
+
+    def get_pipeline(self):
+        return self.pipeline
+
+    def start_streaming(self):
+        self._started = GLib.get_monotonic_time()
+        CameraBoxBase.start_streaming(self)
+
+    def stop(self):
+        if self._resize_id is not None:
+            GLib.source_remove(self._resize_id)
+            self._resize_id = None
+        self.stop_device_monitor()
+        CameraBoxBase.stop(self)
+        self.destroy_pipeline()
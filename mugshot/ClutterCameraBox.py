@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   Portions of this file are adapted from web_cam_box,
+#   Copyright (C) 2010 Rick Spencer <rick.spencer@canonical.com>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('Cheese', '3.0')
+gi.require_version('GtkClutter', '1.0')
+
+from gi.repository import Gst  # nopep8
+from gi.repository import Cheese, Clutter, GtkClutter  # nopep8
+
+from mugshot_lib import capture  # nopep8
+from mugshot.CameraBox import CameraBoxBase  # nopep8
+
+logger = logging.getLogger('mugshot')
+
+# Name of the videorate added to the Cheese filter.
+rate_name = 'mugshot-rate'
+
+
+def get_device_node(data):
+    """Return the device node of a Cheese camera device, or None."""
+    if "get_device_node" in dir(data):
+        return data.get_device_node()
+    return None
+
+
+class ClutterCameraBox(CameraBoxBase, GtkClutter.Embed):
+
+    '''
+    Camera preview shown on a Clutter stage, with Cheese handling the devices
+    and the pipeline.
+
+    Keyword arguments:
+    - parent: The camera dialog.
+    - size:   Side of the square photos.
+    - burst:  Number of frames to pick the sharpest photo from.
+    - device: Node of the preferred camera, used if it is connected.
+    '''
+    __gsignals__ = dict(CameraBoxBase.signals)
+
+    def __init__(self, parent, size=512, burst=1, device=None):
+        Clutter.init(None)
+        GtkClutter.Embed.__init__(self)
+        self.init_camera(parent, size, burst)
+        self.frame_size = (size, size)
+        self.preferred_device = device
+
+        self.video_texture = self.setup_ui()
+        self._pipeline = None
+
+        self.camera = Cheese.Camera.new(self.video_texture,
+                                        "Mugshot", size, size)
+        Cheese.Camera.setup(self.camera, None)
+
+        # Collect the devices found by coldplug and choose one afterwards,
+        # so the pipeline is not rebuilt for every video node.
+        self.devices = []
+        self._coldplugging = True
+        self.device_monitor = Cheese.CameraDeviceMonitor.new()
+        self.device_monitor.connect("added", self.on_device_added)
+        self.device_monitor.connect("removed", self.on_device_removed)
+        self.device_monitor.coldplug()
+        self._coldplugging = False
+
+        nodes = [get_device_node(data) for data in self.devices]
+        node = capture.choose_device([node for node in nodes if node],
+                                     device)
+        if node is not None:
+            self.select_device(self.devices[nodes.index(node)], False)
+        elif self.devices:
+            self.select_device(self.devices[0], False)
+
+        self.negotiate_format()
+
+        self.camera.connect("photo-taken", self.on_photo_taken)
+        self.camera.connect("state-flags-changed", self.on_state_flags_changed)
+
+    def select_device(self, data, switch=True):
+        """Use the camera device data. If switch is True, the running
+        pipeline is moved to it."""
+        node = get_device_node(data)
+        if node is not None:
+            self.camera.set_device_by_device_node(node)
+        else:
+            self.camera.set_device(data)
+        self.device = node
+        logger.debug('Using camera device %s' % node)
+        if switch:
+            self.camera.switch_camera_device()
+            self.negotiate_format()
+
+    def on_device_added(self, monitor, data):
+        """Remember a new device. After coldplug, switch to it only if it is
+        the preferred device or no device was in use."""
+        self.devices.append(data)
+        if self._coldplugging:
+            return
+        node = get_device_node(data)
+        if self.device is None or (node is not None and
+                                   node == self.preferred_device and
+                                   node != self.device):
+            self.select_device(data)
+
+    def on_device_removed(self, monitor, data):
+        """Forget a device, switching to another if it was in use."""
+        node = get_device_node(data)
+        for known in list(self.devices):
+            if known is data or (node is not None and
+                                 get_device_node(known) == node):
+                self.devices.remove(known)
+        if node is None or node != self.device:
+            return
+        self.device = None
+        if self.devices:
+            self.select_device(self.devices[0])
+
+    def setup_ui(self):
+        viewport = self.get_stage()
+
+        video_preview = Clutter.Actor.new()
+        video_preview.set_content_gravity(Clutter.ContentGravity.RESIZE_ASPECT)
+        video_preview.set_x_expand(True)
+        video_preview.set_y_expand(True)
+        video_preview.props.min_height = 100.0
+        video_preview.props.min_width = 100.0
+        video_texture = video_preview
+
+        viewport_layout = Clutter.Actor.new()
+        viewport_layout.add_child(video_preview)
+
+        viewport_layout_manager = Clutter.BinLayout()
+
+        background_layer = Clutter.Actor.new()
+        background_layer.props.background_color = \
+            Clutter.Color.from_string("Black")[1]
+        background_layer.props.x = 0
+        background_layer.props.y = 0
+        background_layer.props.width = 100
+        background_layer.props.height = 100
+
+        video_preview.props.request_mode = Clutter.RequestMode.HEIGHT_FOR_WIDTH
+
+        viewport.add_child(background_layer)
+
+        viewport_layout.set_layout_manager(viewport_layout_manager)
+
+        viewport.add_child(viewport_layout)
+
+        viewport.connect("allocation_changed", self.on_stage_resize,
+                         viewport_layout, background_layer)
+
+        return video_texture
+
+    def negotiate_format(self):
+        """Capture in the cheapest format of the selected device that covers
+        the photo size, and crop and scale the frames to the photo square
+        inside the pipeline instead of after each capture."""
+        device = self.camera.get_selected_device()
+        if device is None:
+            return
+        formats = device.get_format_list()
+        sizes = [(video_format.width, video_format.height)
+                 for video_format in formats]
+        chosen = capture.choose_format(sizes, self.size)
+        if chosen is None:
+            return
+
+        current = self.camera.get_current_video_format()
+        if current is None or (current.width, current.height) != chosen:
+            logger.debug('Using camera format %ix%i' % chosen)
+            self.camera.set_video_format(formats[sizes.index(chosen)])
+
+        description = capture.get_filter_description(chosen[0], chosen[1],
+                                                     self.size)
+        # Limit the frame rate in the filter, Cheese has no other hook.
+        description += " ! videorate name=%s drop-only=true" % rate_name
+        logger.debug('Camera filter: %s' % description)
+        self.camera.set_effect(Cheese.Effect.new("mugshot", description))
+        self.set_preview_rate(self.preview_rate)
+        if self.power.state != capture.RELEASED:
+            # The rate limit was replaced with the filter.
+            self.attach_frames()
+        side = capture.get_output_size(chosen[0], chosen[1], self.size)
+        self.frame_size = (side, side)
+
+    def on_stage_resize(self, actor, box, flags, layout, background):
+        s_width, s_height = self.get_stage().get_size()
+
+        v_width, v_height = self.frame_size
+
+        square = min(s_width, s_height)
+        if v_width > v_height:
+            scale = square / v_height
+            v_height = square
+            v_width = v_width * scale
+        else:
+            scale = square / v_width
+            v_height = v_height * scale
+            v_width = square
+
+        x_adj, y_adj = (s_width - v_width) / 2.0, (s_height - v_height) / 2.0
+
+        layout.set_size(v_width, v_height)
+        layout.set_x(x_adj)
+        layout.set_y(y_adj)
+
+        background.set_size(s_width, s_height)
+
+    def on_state_flags_changed(self, camera, state):
+        self.state = state
+        self.emit("gst-state-changed", self.state)
+
+    def get_video_sink(self):
+        """Return the sink element of the video texture, or None."""
+        content = self.video_texture.get_content()
+        if content is None:
+            return None
+        return content.get_property("sink")
+
+    def get_pipeline(self):
+        """Return the Cheese pipeline, found from the sink of the video
+        texture, or None."""
+        if self._pipeline is None:
+            element = self.get_video_sink()
+            while element is not None and element.get_parent() is not None:
+                element = element.get_parent()
+            if isinstance(element, Gst.Pipeline):
+                self._pipeline = element
+        return self._pipeline
+
+    def get_rate_element(self):
+        pipeline = self.get_pipeline()
+        if pipeline is None:
+            return None
+        return pipeline.get_by_name(rate_name)
+
+    def prepare(self, release_timeout=None):
+        """Do nothing, Cheese only opens the device to stream from it."""
+
+    def attach_frames(self):
+        """Buffer the frames entering the preview rate limit, or those
+        reaching the video sink if there is none."""
+        element = self.get_rate_element()
+        if element is None:
+            element = self.get_video_sink()
+        if element is not None:
+            self.frames.attach(element.get_static_pad("sink"))
+
+    def start_streaming(self):
+        Cheese.Camera.play(self.camera)
+        self.attach_frames()
+
+    def stop_streaming(self):
+        Cheese.Camera.stop(self.camera)
+
+    def capture_frame(self):
+        return self.camera.take_photo_pixbuf()
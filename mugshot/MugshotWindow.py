@@ -20,15 +20,16 @@ from locale import gettext as _
 
 import logging
 import os
-import shutil
 import subprocess
+import threading
 
-import pexpect
-
-from gi.repository import Gio, Gtk, GdkPixbuf, GLib  # pylint: disable=E0611
+from gi.repository import Gio, Gtk, GLib  # pylint: disable=E0611
 
 
 from mugshot_lib import Window, SudoDialog, AccountsServiceAdapter, helpers
+from mugshot_lib import PrivilegedHelper, PreviewLoader, ThumbnailLoader
+from mugshot_lib import FaceAtlas, faces, imaging, pixbufs
+from mugshot_lib import thumbnails
 
 try:
     from mugshot.CameraMugshotDialog import CameraMugshotDialog
@@ -42,7 +43,18 @@ home = GLib.get_home_dir()
 libreoffice_prefs = os.path.join(GLib.get_user_config_dir(), 'libreoffice',
                                  '4', 'user', 'registrymodifications.xcu')
 pidgin_prefs = os.path.join(home, '.purple', 'prefs.xml')
-faces_dir = '/usr/share/pixmaps/faces/'
+pidgin_buddyicon = os.path.join(GLib.get_user_data_dir(), 'mugshot',
+                                'buddyicon')
+
+# Size of the profile image handed to each of its consumers.
+user_image_size = 128
+pidgin_icon_size = 96
+accounts_service_icon_size = 256
+stock_icon_size = 90
+
+# Value of updated_image once the profile image has been removed. Otherwise
+# it is None while the image is unchanged, or the new pixbufs.AvatarImage.
+removed_image = object()
 
 
 def which(command):
@@ -95,6 +107,21 @@ def has_gstreamer_camerasrc_support():
     return has_support
 
 
+def has_gstreamer_gtksink_support():
+    """Return True if gstreamer1.0 gtksink element is available."""
+    process = subprocess.Popen(["gst-inspect-1.0", "gtksink"],
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.PIPE)
+    process.communicate()
+    has_support = process.returncode == 0
+    if not has_support:
+        element = 'gtksink'
+        plugin = 'gstreamer1.0-gtk3'
+        logger.debug('%s element unavailable. '
+                     'Do you have %s installed?' % (element, plugin))
+    return has_support
+
+
 def has_camera_libraries():
     """Return True if it is possible to display the camera dialog."""
     try:
@@ -118,10 +145,13 @@ def get_has_camera_support():
         return False
     if not which('gst-inspect-1.0'):
         return False
-    if not has_gstreamer_camerabin_support():
-        return False
     if not has_gstreamer_camerasrc_support():
         return False
+    # The GTK preview only needs gtksink, the Clutter preview needs Cheese.
+    if has_gstreamer_gtksink_support():
+        return True
+    if not has_gstreamer_camerabin_support():
+        return False
     if not has_camera_libraries():
         return False
     return True
@@ -176,8 +206,14 @@ class MugshotWindow(Window):
         self.image_menu = builder.get_object('image_menu')
         self.image_from_camera = builder.get_object('image_from_camera')
         self.image_from_stock = builder.get_object('image_from_stock')
-        self.image_from_stock.set_visible(os.path.exists(faces_dir) and
-                                          len(os.listdir(faces_dir)) > 0)
+        self.faces_index = faces.FaceDirectoryIndex(
+            faces.get_faces_dirs(self.settings['stock-faces-dir']))
+        self.faces_index.scan()
+        self.faces_index.connect('face-added', self.on_face_added)
+        self.faces_index.connect('face-removed', self.on_face_removed)
+        self.faces_index.connect('face-changed', self.on_face_changed)
+        self.faces_index.monitor()
+        self.image_from_stock.set_visible(not self.faces_index.is_empty())
         self.menuitem1 = builder.get_object('menuitem1')
         self.image_remove = builder.get_object('image_remove')
 
@@ -199,6 +235,28 @@ class MugshotWindow(Window):
         # Stock photo browser
         self.stock_browser = builder.get_object('stock_browser')
         self.iconview = builder.get_object('stock_iconview')
+        self.stock_model = builder.get_object('liststore1')
+        self.stock_filter = builder.get_object('stock_filter')
+        self.stock_filter.set_visible_func(self.stock_filter_visible)
+        self.stock_rows = {}
+        self.stock_loaded = False
+        self.stock_materialized = set()
+        self.stock_window = set()
+        self.stock_placeholder = None
+        self.stock_atlas = None
+        self.stock_atlas_building = False
+        self.stock_index = faces.FaceSearchIndex()
+        self.stock_matches = None
+        self.stock_update_id = None
+        self.thumbnail_loader = ThumbnailLoader.ThumbnailLoader(
+            stock_icon_size, thumbnails.ThumbnailCache(stock_icon_size))
+        self.thumbnail_loader.connect('thumbnail-loaded',
+                                      self.on_stock_thumbnail_loaded)
+        scrolled = builder.get_object('scrolledwindow1')
+        scrolled.get_vadjustment().connect('value-changed',
+                                           self.on_stock_browser_scrolled)
+        scrolled.get_vadjustment().connect('changed',
+                                           self.on_stock_browser_scrolled)
 
         # File Chooser Dialog
         self.chooser = builder.get_object('filechooserdialog')
@@ -211,6 +269,14 @@ class MugshotWindow(Window):
         image_filter.set_name('Images')
         image_filter.add_mime_type('image/*')
         self.chooser.add_filter(image_filter)
+        # Decode previews in the background.
+        self.preview_loader = PreviewLoader.PreviewLoader(
+            min_side=128 * pixbufs.OVERSAMPLE)
+        self.preview_loader.connect('preview-loaded', self.on_preview_loaded)
+
+        # Selected images are reduced once, before they are saved.
+        self.avatar_normalizer = \
+            pixbufs.AvatarNormalizer.new_from_settings(self.settings)
 
         self.tmpfile = None
 
@@ -245,8 +311,12 @@ class MugshotWindow(Window):
         if not self.accounts_service.available():
             # AccountsService may not be supported or desired.
             logger.debug("AccountsService is not supported.")
-            self.updated_image = face
             self.set_user_image(face)
+            if self.avatar_image is not None:
+                self.updated_image = self.avatar_image
+            elif not os.path.exists(face):
+                self.updated_image = removed_image
+            # An unreadable ~/.face is left alone rather than removed.
 
         # If it is supported, process and compare to ~/.face
         else:
@@ -254,17 +324,17 @@ class MugshotWindow(Window):
             logger.debug('Found profile image: %s' % str(image))
 
             if os.path.isfile(face):
+                self.set_user_image(face)
                 try:
                     if os.path.samefile(image, face):
-                        self.updated_image = face
+                        self.updated_image = self.avatar_image
                     else:
                         self.updated_image = None
                 except FileNotFoundError:
                     self.updated_image = None
-                self.set_user_image(face)
             elif os.path.isfile(image):
-                self.updated_image = image
                 self.set_user_image(image)
+                self.updated_image = self.avatar_image
             else:
                 self.updated_image = None
                 self.set_user_image(None)
@@ -291,21 +361,36 @@ class MugshotWindow(Window):
         self.fax_entry.set_text(self.fax)
 
     # = Mugshot Window ====================================================== #
+    def load_avatar_image(self, filename):
+        """Return filename as a pixbufs.AvatarImage, or None if it cannot be
+        loaded."""
+        if not filename or not os.path.exists(filename):
+            return None
+        try:
+            # Decode once, other sizes are taken from the pyramid.
+            return pixbufs.AvatarImage.new_from_file(
+                filename, self.avatar_normalizer.max_size)
+        except (GLib.Error, OSError, TypeError):  # pylint: disable=E0712
+            # An unreadable or vanished file must not stop the window.
+            logger.debug("Unable to load %s" % filename)
+            return None
+
     def set_user_image(self, filename=None):
         """Scale and set the user profile image."""
         logger.debug("Setting user profile image to %s" % str(filename))
-        if filename and os.path.exists(filename):
-            try:
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file(filename)
-                scaled = pixbuf.scale_simple(128, 128,
-                                             GdkPixbuf.InterpType.HYPER)
-                self.user_image.set_from_pixbuf(scaled)
-                # Show "Remove" menu item.
-                self.menuitem1.set_visible(True)
-                self.image_remove.set_visible(True)
-                return
-            except GLib.Error:  # pylint: disable=E0712
-                pass
+        self.set_avatar_image(self.load_avatar_image(filename))
+
+    def set_avatar_image(self, image):
+        """Set the user profile image from a pixbufs.AvatarImage, or
+        None."""
+        self.avatar_image = image
+        if image is not None:
+            scaled = image.get_pixbuf(user_image_size, user_image_size)
+            self.user_image.set_from_pixbuf(scaled)
+            # Show "Remove" menu item.
+            self.menuitem1.set_visible(True)
+            self.image_remove.set_visible(True)
+            return
 
         self.user_image.set_from_icon_name('avatar-default', 128)
         # Hide "Remove" menu item.
@@ -398,51 +483,79 @@ class MugshotWindow(Window):
         logger.debug('Cancel clicked, goodbye.')
         self.destroy()
 
+    def on_image_button_toggled(self, widget):
+        """List the cameras while the image menu is open, and stop a
+        pre-warmed camera once it closes unless it was chosen."""
+        if not widget.get_active():
+            self.cancel_camera_prewarm()
+        elif self.image_from_camera.get_visible():
+            self.probe_camera()
+
+    def on_image_from_camera_select(self, widget):
+        """Open the camera once the camera item is highlighted, as it is
+        likely to be chosen."""
+        self.prewarm_camera()
+
     def on_image_remove_activate(self, widget):
         """Remove the user's profile image."""
-        self.updated_image = ""
-        self.set_user_image(None)
+        self.updated_image = removed_image
+        self.set_avatar_image(None)
 
     def on_camera_dialog_apply(self, widget, data=None):
-        """Commit changes when apply is clicked."""
+        """Commit changes when apply is clicked. data is the photo, a
+        pixbufs.AvatarImage."""
+        if data is None:
+            return
         self.updated_image = data
-        self.set_user_image(data)
+        self.set_avatar_image(data)
 
     def save_image(self):
-        """Copy the updated image filename to ~/.face"""
+        """Save the updated image to ~/.face and hand it to the other
+        consumers, encoding it straight to each destination."""
         # Check if the image has been updated.
         if self.updated_image is None:
             logger.debug('Photo not updated, not saving changes.')
             return False
 
-        if not os.path.isfile(self.updated_image):
-            self.updated_image = ""
+        image = self.updated_image
+        if image is removed_image:
+            image = None
 
         face = os.path.join(home, '.face')
 
-        if os.path.normpath(face) != os.path.normpath(self.updated_image):
+        if image is None or not image.is_file(face):
             # If the .face file already exists, remove it first.
-            logger.debug('Photo updated, saving ~/.face profile image.')
             if os.path.isfile(face):
                 os.remove(face)
-            # Copy the new file to ~/.face
-            if os.path.isfile(self.updated_image):
-                shutil.copyfile(self.updated_image, face)
+            if image is not None:
+                logger.debug('Photo updated, saving ~/.face profile image.')
+                image.save(face, self.avatar_normalizer)
 
         # Update AccountsService profile image
         if self.accounts_service.available():
             logger.debug(
                 'Photo updated, saving AccountsService profile image.')
-            self.accounts_service.set_icon_file(self.updated_image)
+            icon_file = ""
+            if image is not None:
+                # AccountsService copies the icon from a file it can read,
+                # use the original when it is small enough.
+                icon_file = image.get_file_at_most(accounts_service_icon_size)
+            if image is not None and icon_file is None:
+                icon_file = helpers.new_tempfile('accounts-service')
+                image.save_at_most(icon_file, accounts_service_icon_size,
+                                   self.avatar_normalizer)
+            self.accounts_service.set_icon_file(icon_file)
+            helpers.remove_tempfile('accounts-service')
 
         # Update Pidgin buddy icon
-        self.set_pidgin_buddyicon(self.updated_image)
+        self.set_pidgin_buddyicon(image)
 
         self.updated_image = None
         return True
 
-    def set_pidgin_buddyicon(self, filename=None):
-        """Sets the pidgin buddyicon to filename (usually ~/.face).
+    def set_pidgin_buddyicon(self, image=None):
+        """Sets the pidgin buddyicon to a buddy icon sized copy of image, a
+        pixbufs.AvatarImage, or removes it if image is None.
 
         If pidgin is running, use the dbus interface, otherwise directly modify
         the XML file."""
@@ -455,6 +568,12 @@ class MugshotWindow(Window):
         update_pidgin = get_confirmation_dialog(self, primary, secondary,
                                                 'pidgin')
         if update_pidgin:
+            filename = None
+            if image is not None:
+                os.makedirs(os.path.dirname(pidgin_buddyicon), exist_ok=True)
+                image.save_at_most(pidgin_buddyicon, pidgin_icon_size,
+                                   self.avatar_normalizer)
+                filename = pidgin_buddyicon
             if has_running_process('pidgin'):
                 self.set_pidgin_buddyicon_dbus(filename)
             else:
@@ -540,24 +659,10 @@ class MugshotWindow(Window):
         logger.debug('chfn details have NOT been modified.')
         return False
 
-    def process_terminal_password(self, command, password):
-        """Handle password prompts from the interactive chfn commands."""
-        # Force the C language for guaranteed english strings in the script.
-        logger.debug('Executing: %s' % command)
-        child = SudoDialog.env_spawn(command, [], 5)
-        child.write_to_stdout = True
-        try:
-            child.expect([".*ssword.*", pexpect.EOF])
-            child.sendline(password)
-            child.expect([pexpect.EOF])
-        except pexpect.TIMEOUT:
-            logger.warning('Timeout reached, password was likely incorrect.')
-        child.close(True)
-        return child.exitstatus == 0
-
     def save_chfn_details(self):
         """Commit changes to chfn-related details.  For full name, changes must
         be performed as root.  Other changes are done with the user password.
+        The password is validated once, then used through the SudoSession.
 
         Return TRUE if successful."""
         success = True
@@ -572,15 +677,12 @@ class MugshotWindow(Window):
                                             "to your personal information."))
         response = sudo_dialog.run()
         sudo_dialog.hide()
-        password = sudo_dialog.get_password()
+        session = sudo_dialog.get_session()
         sudo_dialog.destroy()
 
-        if not password:
+        if not session:
             return (False, response)
 
-        sudo = which('sudo')
-        chfn = which('chfn')
-
         # Get each of the updated values.
         first_name = get_entry_value(self.first_name_entry)
         last_name = get_entry_value(self.last_name_entry)
@@ -593,40 +695,68 @@ class MugshotWindow(Window):
         if home_phone == '':
             home_phone = 'none'
 
+        edits = {'home_phone': home_phone, 'office_phone': office_phone}
+        results = self.apply_chfn_edits(session, edits, False)
+
         # Full name can only be modified by root.  Try using sudo to modify.
         if not self.accounts_service.available():
             if SudoDialog.check_dependencies(['chfn']):
-                logger.debug('Updating Full Name...')
-                command = "%s %s -f \"%s\" %s" % (sudo, chfn, full_name,
-                                                  username)
-                if self.process_terminal_password(command, password):
-                    self.first_name = first_name
-                    self.last_name = last_name
-                else:
-                    success = False
-
-        logger.debug('Updating Home Phone...')
-        command = "%s -h \"%s\" %s" % (chfn, home_phone, username)
-        if self.process_terminal_password(command, password):
+                root_edits = {'full_name': full_name}
+                edits.update(root_edits)
+                root_results = None
+                # Starting the helper costs a sudo command itself, it only
+                # pays off for more than one edit.
+                if self.settings['privileged-helper'] and len(root_edits) > 1:
+                    root_results = self.apply_chfn_edits_helper(session,
+                                                                root_edits)
+                if root_results is None:
+                    root_results = self.apply_chfn_edits(session, root_edits)
+                results.update(root_results)
+        session.close()
+
+        if results.get('full_name', False):
+            self.first_name = first_name
+            self.last_name = last_name
+        if results.get('home_phone', False):
             self.home_phone = home_phone
-        else:
-            success = False
-
-        logger.debug('Updating Office Phone...')
+        if results.get('office_phone', False):
+            self.office_phone = office_phone
 
-        # chfn 2.29 uses "-p" as parameter for changing the office-phone (LP: #1699285)
-        p_command = "%s -p \"%s\" %s" % (chfn, office_phone, username)
+        for field in edits.keys():
+            if not results.get(field, False):
+                success = False
 
-        # other (newer, older?) use "-w"
-        w_command = "%s -w \"%s\" %s" % (chfn, office_phone, username)
+        return (success, response)
 
-        if self.process_terminal_password(p_command, password) or \
-                self.process_terminal_password(w_command, password):
-            self.office_phone = office_phone
-        else:
-            success = False
+    def apply_chfn_edits(self, session, edits, as_root=True):
+        """Apply each chfn edit with a separate command, run with sudo if
+        as_root is True and as the user otherwise.
 
-        return (success, response)
+        Return a dictionary of field: success."""
+        chfn = which('chfn')
+        run = session.run if as_root else session.run_as_user
+        results = {}
+        for field, value in edits.items():
+            logger.debug('Updating %s...' % field)
+            results[field] = False
+            for flags in PrivilegedHelper.chfn_fields[field]:
+                if run([chfn] + flags + [value, username]):
+                    results[field] = True
+                    break
+        return results
+
+    def apply_chfn_edits_helper(self, session, edits):
+        """Apply the root-only chfn edits in a single batch with the
+        privileged helper.
+
+        Return a dictionary of field: success, or None if the helper could not
+        be used."""
+        helper = PrivilegedHelper.PrivilegedHelper(username)
+        if not helper.start(session):
+            return None
+        results = helper.apply(edits)
+        helper.stop()
+        return results
 
     # = LibreOffice ========================================================= #
     def get_libreoffice_details_updated(self):
@@ -969,22 +1099,216 @@ class MugshotWindow(Window):
         self.stock_browser.show_all()
 
     def load_stock_browser(self):
-        """Load the stock photo browser."""
-        # Check if the photos have already been loaded.
-        model = self.iconview.get_model()
-        if len(model) != 0:
+        """Load the stock photo browser.
+
+        Every photo is listed straight away, sharing a single placeholder
+        image. Thumbnails are only kept for the rows on screen and a page
+        either side of them (see update_stock_thumbnails), so memory use does
+        not grow with the size of the collection."""
+        # Check if the photos have already been loaded. Once they have, the
+        # faces index keeps the browser up to date.
+        if self.stock_loaded:
             logger.debug("Stock browser already loaded.")
             return
 
-        # If they have not, load each photo from faces_dir.
+        # If they have not, list each photo in the faces index.
         logger.debug("Loading stock browser photos.")
-        for filename in os.listdir(faces_dir):
-            full_path = os.path.join(faces_dir, filename)
-            if os.path.isfile(full_path):
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file(full_path)
-                scaled = pixbuf.scale_simple(90, 90,
-                                             GdkPixbuf.InterpType.HYPER)
-                model.append([full_path, scaled])
+        self.stock_loaded = True
+        self.stock_placeholder = self.get_stock_placeholder()
+        filenames = self.faces_index.get_faces()
+        self.stock_atlas = self.get_face_atlas(filenames)
+        for filename in filenames:
+            self.append_stock_photo(filename)
+        self.stock_index.extend(filenames)
+        logger.debug("Listed %i stock photos." % len(filenames))
+        self.queue_stock_thumbnails_update()
+
+    def append_stock_photo(self, filename):
+        """Add a row for filename to the stock browser."""
+        treeiter = self.stock_model.append([filename, self.stock_placeholder])
+        self.stock_rows[filename] = Gtk.TreeRowReference.new(
+            self.stock_model, self.stock_model.get_path(treeiter))
+
+    def remove_stock_photo(self, filename):
+        """Remove the row for filename from the stock browser."""
+        row = self.stock_rows.pop(filename, None)
+        if row is not None and row.valid():
+            self.stock_model.remove(self.stock_model.get_iter(row.get_path()))
+        self.stock_index.remove(filename)
+        self.stock_materialized.discard(filename)
+
+    def on_face_added(self, index, filename):
+        """Show a newly installed stock photo."""
+        self.image_from_stock.set_visible(True)
+        if not self.stock_loaded:
+            return
+        self.append_stock_photo(filename)
+        self.stock_index.add(filename)
+        if self.stock_matches is not None:
+            # Match the new photo against the current search.
+            self.on_stock_search_changed(
+                self.builder.get_object('stock_search'))
+        self.queue_stock_thumbnails_update()
+
+    def on_face_removed(self, index, filename):
+        """Remove a deleted stock photo."""
+        self.image_from_stock.set_visible(not index.is_empty())
+        if self.stock_loaded:
+            self.remove_stock_photo(filename)
+
+    def on_face_changed(self, index, filename):
+        """Reload the thumbnail of a modified stock photo."""
+        if filename in self.stock_materialized:
+            self.stock_materialized.discard(filename)
+            self.set_stock_thumbnail(filename, self.stock_placeholder)
+            self.queue_stock_thumbnails_update()
+
+    def open_face_atlas(self, directory):
+        """Return the stock face atlas in directory, or None."""
+        atlas = FaceAtlas.FaceAtlas.open(directory)
+        if atlas is None or atlas.size != stock_icon_size:
+            return None
+        return atlas
+
+    def get_face_atlas(self, filenames):
+        """Return the stock face atlas for filenames: the one built for the
+        whole system if it is current, otherwise the one in the user cache,
+        which is rebuilt in a worker thread if it is missing or out of date.
+        An out of date atlas still serves the faces that did not change."""
+        system_atlas = self.open_face_atlas(FaceAtlas.system_cache_dir)
+        if system_atlas is not None and system_atlas.covers(filenames):
+            logger.debug("Using the system stock face atlas with %i faces." %
+                         len(system_atlas))
+            return system_atlas
+        user_atlas = self.open_face_atlas(FaceAtlas.get_cache_dir())
+        if user_atlas is None or not user_atlas.covers(filenames):
+            self.update_face_atlas(filenames)
+        if user_atlas is not None:
+            logger.debug("Using the stock face atlas with %i faces." %
+                         len(user_atlas))
+            return user_atlas
+        return system_atlas
+
+    def update_face_atlas(self, filenames):
+        """Rebuild the face atlas in the user cache in a worker thread, so
+        later sessions can use it."""
+        if self.stock_atlas_building:
+            return
+        logger.debug("Building the stock face atlas.")
+        self.stock_atlas_building = True
+        worker = threading.Thread(target=self._build_face_atlas,
+                                  args=(list(filenames),), daemon=True)
+        worker.start()
+
+    def _build_face_atlas(self, filenames):
+        """Build the face atlas. Called from a worker thread."""
+        try:
+            FaceAtlas.build_atlas_from_files(
+                filenames, FaceAtlas.get_cache_dir(), stock_icon_size)
+        except (GLib.Error, OSError) as error:  # pylint: disable=E0712
+            logger.debug("Unable to build the stock face atlas: %s" % error)
+        GLib.idle_add(self._on_face_atlas_built)
+
+    def _on_face_atlas_built(self):
+        """Use the new face atlas."""
+        self.stock_atlas_building = False
+        atlas = self.open_face_atlas(FaceAtlas.get_cache_dir())
+        if atlas is not None:
+            self.stock_atlas = atlas
+        return False
+
+    def get_stock_placeholder(self):
+        """Return the image displayed while a stock photo is loading."""
+        try:
+            return Gtk.IconTheme.get_default().load_icon(
+                'avatar-default', stock_icon_size,
+                Gtk.IconLookupFlags.FORCE_SIZE)
+        except GLib.Error:  # pylint: disable=E0712
+            return None
+
+    def get_stock_window(self):
+        """Return the filenames of the visible stock photos and a page of
+        photos either side of them."""
+        visible_range = self.iconview.get_visible_range()
+        if not visible_range:
+            return []
+        start = visible_range[0].get_indices()[0]
+        end = visible_range[1].get_indices()[0] + 1
+        margin = end - start
+        start = max(0, start - margin)
+        end = min(len(self.stock_filter), end + margin)
+        return [self.stock_filter[index][0] for index in range(start, end)]
+
+    def set_stock_thumbnail(self, filename, pixbuf):
+        """Show pixbuf for filename in the stock browser."""
+        row = self.stock_rows.get(filename, None)
+        if row is None or not row.valid():
+            return
+        treeiter = self.stock_model.get_iter(row.get_path())
+        self.stock_model.set_value(treeiter, 1, pixbuf)
+
+    def queue_stock_thumbnails_update(self):
+        """Update the stock thumbnails once scrolling or resizing settles."""
+        if self.stock_update_id is None:
+            self.stock_update_id = GLib.idle_add(self.update_stock_thumbnails)
+
+    def update_stock_thumbnails(self):
+        """Materialize the thumbnails near the visible rows and drop the
+        rest, replacing them with the shared placeholder."""
+        self.stock_update_id = None
+        window = self.get_stock_window()
+        self.stock_window = set(window)
+
+        for filename in self.stock_materialized - self.stock_window:
+            self.set_stock_thumbnail(filename, self.stock_placeholder)
+        self.stock_materialized &= self.stock_window
+
+        # Only the current window is queued, anything still pending from a
+        # previous position is no longer needed.
+        self.thumbnail_loader.cancel()
+        filenames = []
+        for filename in window:
+            if filename in self.stock_materialized:
+                continue
+            pixbuf = None
+            if self.stock_atlas is not None:
+                pixbuf = self.stock_atlas.lookup(filename)
+            if pixbuf is None:
+                filenames.append(filename)
+            else:
+                self.set_stock_thumbnail(filename, pixbuf)
+                self.stock_materialized.add(filename)
+        if filenames:
+            self.thumbnail_loader.request(filenames)
+        return False
+
+    def on_stock_thumbnail_loaded(self, loader, filename, pixbuf):
+        """Replace the placeholder once a stock photo has been loaded."""
+        row = self.stock_rows.get(filename, None)
+        if row is None or not row.valid():
+            return
+        if pixbuf is None:
+            # Not an image, remove it from the browser.
+            self.remove_stock_photo(filename)
+        elif filename in self.stock_window:
+            self.set_stock_thumbnail(filename, pixbuf)
+            self.stock_materialized.add(filename)
+
+    def on_stock_browser_scrolled(self, adjustment):
+        """Load the photos that have been scrolled into view."""
+        self.queue_stock_thumbnails_update()
+
+    def stock_filter_visible(self, model, treeiter, data=None):
+        """Show only the stock photos matching the search."""
+        if self.stock_matches is None:
+            return True
+        return model[treeiter][0] in self.stock_matches
+
+    def on_stock_search_changed(self, widget):
+        """Filter the stock photos by name and tags."""
+        self.stock_matches = self.stock_index.search(widget.get_text())
+        self.stock_filter.refilter()
+        self.queue_stock_thumbnails_update()
 
     def on_stock_iconview_selection_changed(self, widget):
         """Enable stock submission only when an item is selected."""
@@ -1011,9 +1335,14 @@ class MugshotWindow(Window):
             filename = self.iconview.get_model()[path][0]
             logger.debug("Selected %s" % filename)
 
+            # Keep the current image if the face cannot be loaded.
+            image = self.load_avatar_image(filename)
+            if image is None:
+                return
+
             # Update variables and widgets, then hide.
-            self.set_user_image(filename)
-            self.updated_image = filename
+            self.updated_image = image
+            self.set_avatar_image(image)
             self.stock_browser.hide()
 
     def on_stock_iconview_item_activated(self, widget, path):
@@ -1025,64 +1354,75 @@ class MugshotWindow(Window):
         """Browse for a user profile image."""
         # Run the dialog, grab the filename if confirmed, then hide the dialog.
         response = self.chooser.run()
+        self.preview_loader.cancel()
         if response == Gtk.ResponseType.APPLY:
-            # Update the user image, store the path for committing later.
-            self.updated_image = helpers.new_tempfile('browse')
-            self.filechooser_preview_pixbuf.savev(self.updated_image, "png",
-                                                  [], [])
-            logger.debug("Selected %s" % self.updated_image)
-            self.set_user_image(self.updated_image)
+            filename = self.chooser.get_filename()
+            try:
+                pixbuf = pixbufs.load_pixbuf(
+                    filename, self.avatar_normalizer.get_decode_side())
+            except (GLib.Error, OSError, TypeError):  # pylint: disable=E0712
+                logger.debug("Unable to load %s" % str(filename))
+                self.chooser.hide()
+                return
+            # Update the user image, keep it in memory until it is saved.
+            image = pixbufs.AvatarImage.new_from_pixbuf(
+                self.crop_pixbuf(pixbuf), self.avatar_normalizer)
+            logger.debug("Selected %s" % filename)
+            self.updated_image = image
+            self.set_avatar_image(image)
         self.chooser.hide()
 
+    def get_crop_style(self):
+        """Return the crop style selected in the file chooser."""
+        if self.crop_left.get_active():
+            return imaging.CROP_LEFT
+        if self.crop_right.get_active():
+            return imaging.CROP_RIGHT
+        return imaging.CROP_CENTER
+
+    def crop_pixbuf(self, pixbuf):
+        """Crop pixbuf to a square using the selected crop style."""
+        return pixbufs.crop_square(pixbuf, self.get_crop_style())
+
+    def set_file_chooser_preview(self, pixbuf):
+        """Crop and scale the decoded pixbuf into the file chooser preview."""
+        scaled = pixbufs.resample(self.crop_pixbuf(pixbuf), 128, 128)
+        self.file_chooser_preview.set_from_pixbuf(scaled)
+
     def on_filechooserdialog_update_preview(self, widget):
         """Update the preview image used in the file chooser."""
         filename = widget.get_filename()
         if not filename:
+            self.preview_loader.cancel()
             self.file_chooser_preview.set_from_icon_name('folder', 128)
             return
         if not os.path.isfile(filename):
+            self.preview_loader.cancel()
             self.file_chooser_preview.set_from_icon_name('folder', 128)
             return
-        filechooser_pixbuf = GdkPixbuf.Pixbuf.new_from_file(filename)
-
-        # Get the image dimensions.
-        height = filechooser_pixbuf.get_height()
-        width = filechooser_pixbuf.get_width()
-        start_x = 0
-        start_y = 0
-
-        if self.crop_center.get_active():
-            # Calculate a balanced center.
-            if width > height:
-                start_x = (width - height) / 2
-                width = height
-            else:
-                start_y = (height - width) / 2
-                height = width
 
-        elif self.crop_left.get_active():
-            start_x = 0
-            if width > height:
-                width = height
-            else:
-                start_y = (height - width) / 2
-                height = width
-        elif self.crop_right.get_active():
-            if width > height:
-                start_x = width - height
-                width = height
-            else:
-                start_y = (height - width) / 2
-                height = width
+        # Crop the cached image if it has already been decoded.
+        pixbuf = self.preview_loader.lookup(filename)
+        if pixbuf is not None:
+            self.preview_loader.cancel()
+            self.set_file_chooser_preview(pixbuf)
+            return
 
-        # Create a new cropped pixbuf.
-        self.filechooser_preview_pixbuf = \
-            filechooser_pixbuf.new_subpixbuf(start_x, start_y, width, height)
+        # Otherwise, show a quick placeholder from an existing thumbnail while
+        # the full image is decoded in the background.
+        placeholder = thumbnails.load_placeholder(filename)
+        if placeholder is not None:
+            self.set_file_chooser_preview(placeholder)
+        self.preview_loader.request(filename)
 
-        scaled = self.filechooser_preview_pixbuf.scale_simple(
-            128, 128,
-            GdkPixbuf.InterpType.HYPER)
-        self.file_chooser_preview.set_from_pixbuf(scaled)
+    def on_preview_loaded(self, loader, filename, pixbuf):
+        """Update the preview once the selected image has been decoded."""
+        if filename != self.chooser.get_filename():
+            return
+        if pixbuf is None:
+            self.file_chooser_preview.set_from_icon_name('image-missing', 128)
+            return
+        self.set_file_chooser_preview(pixbuf)
 
     def on_crop_changed(self, widget, data=None):
         """Update the preview image when crop style is modified."""
@@ -18,13 +18,10 @@
 
 import argparse
 import signal
+import sys
 
 from locale import gettext as _
 
-from gi.repository import Gtk  # pylint: disable=E0611
-
-from mugshot import MugshotWindow
-
 from mugshot_lib import set_up_logging, get_version, helpers
 
 
@@ -34,14 +31,52 @@ def parse_options():
     parser.add_argument(
         "-v", "--verbose", action="count", dest="verbose",
         help=_("Show debug messages (-vv debugs mugshot_lib also)"))
+    parser.add_argument(
+        "--capture-camera", metavar="FILE", dest="capture_camera",
+        help=_("Take a photo with the camera, save it to FILE and exit"))
+    parser.add_argument(
+        "--device", dest="device",
+        help=_("Camera device to capture from, e.g. /dev/video0"))
+    parser.add_argument(
+        "--delay", type=float, default=1.0, dest="delay",
+        help=_("Seconds to wait before capturing (default: 1)"))
+    parser.add_argument(
+        "--camera-source", default="v4l2src", dest="camera_source",
+        help=_("GStreamer source element to capture from, e.g. "
+               "videotestsrc (default: v4l2src)"))
     options = parser.parse_args()
 
     set_up_logging(options)
+    return options
+
+
+def capture_camera(options):
+    """Capture a photo without loading the main window or the camera
+    dialog. Return the exit status."""
+    from mugshot_lib import capture
+
+    source = options.camera_source
+    if options.device:
+        source = "%s device=%s" % (source, options.device)
+    try:
+        capture.capture_photo(options.capture_camera, source, options.delay)
+    except capture.CaptureError as error:
+        sys.stderr.write("%s\n" % error)
+        return 1
+    return 0
 
 
 def main():
     'constructor for your class instances'
-    parse_options()
+    options = parse_options()
+
+    if options.capture_camera:
+        sys.exit(capture_camera(options))
+
+    # The main window (and the camera libraries it loads) are only imported
+    # when running the application.
+    from gi.repository import Gtk  # pylint: disable=E0611
+    from mugshot import MugshotWindow
 
     # Run the application.
     window = MugshotWindow.MugshotWindow()
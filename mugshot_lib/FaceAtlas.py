@@ -0,0 +1,319 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Prebuilt atlas of stock face thumbnails.
+
+The atlas is built on the machine using it. Packages build one for every
+user into system_cache_dir, from their postinst and from a trigger on the
+system faces directories, by running
+
+    python3 -m mugshot_lib.FaceAtlas
+
+as root. It is mapped read-only by every Mugshot instance, so all sessions
+share the same page cache memory and the stock browser does not decode the
+faces itself. When it is missing or does not cover the faces of a user
+(e.g. faces in ~/.local/share/pixmaps/faces), Mugshot builds one into the
+user cache (see get_cache_dir()) in a worker thread instead. The
+build_face_atlas setup command builds one from a directory, for testing.
+Two files are written:
+
+- faces.atlas: a short header, then raw, unpadded RGBA pixel data of a grid
+  of thumbnails. Each face is written as soon as it is decoded, so the atlas
+  is never held in memory.
+- faces.index: a header, then one fixed size record per face sorted by path,
+  then the paths themselves. Records are looked up by binary search directly
+  in the mapped file. Files that could not be decoded have a record too, so
+  they do not make the atlas look out of date.
+
+Both headers hold the same random generation. The files are replaced one at
+a time, so an index is only used with the atlas of its own generation.
+
+Faces that were modified or added since the atlas was built miss the atlas
+and are loaded normally until it is rebuilt.'''
+
+import argparse
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+
+from gi.repository import GdkPixbuf, GLib  # pylint: disable=E0611
+
+logger = logging.getLogger('mugshot_lib')
+
+ATLAS_FILENAME = 'faces.atlas'
+INDEX_FILENAME = 'faces.index'
+
+MAGIC = b'MUGATLS2'
+# magic, generation, thumbnail size, count, atlas width, height, rowstride
+HEADER = struct.Struct('<8sQIIIII')
+# path offset, path length, mtime (ns), file size, x, y
+RECORD = struct.Struct('<IIqQII')
+
+PIXELS_MAGIC = b'MUGPIXL2'
+# magic, generation
+PIXELS_HEADER = struct.Struct('<8sQ')
+
+# x of the record of a file that could not be decoded.
+SKIPPED = 0xFFFFFFFF
+
+
+def encode_path(filename):
+    """Return filename as bytes, as stored in the index."""
+    return os.fsencode(os.path.abspath(filename))
+
+
+# The atlas built for every user.
+system_cache_dir = '/var/cache/mugshot'
+
+
+def get_system_faces_dirs():
+    """Return the pixmaps/faces directories of the system data directories
+    (XDG_DATA_DIRS), without repeats."""
+    found = []
+    for data_dir in GLib.get_system_data_dirs():
+        directory = os.path.realpath(os.path.join(data_dir, 'pixmaps',
+                                                  'faces'))
+        if directory not in found:
+            found.append(directory)
+    return found
+
+
+def get_cache_dir():
+    """Return the directory the atlas of this user is kept in."""
+    return os.path.join(GLib.get_user_cache_dir(), 'mugshot', 'face-atlas')
+
+
+def build_atlas(faces_dir, output_dir, size=90):
+    """Render every image in faces_dir into an atlas in output_dir.
+
+    Return the number of faces in the atlas."""
+    filenames = [entry.path for entry in os.scandir(faces_dir)
+                 if entry.is_file()]
+    return build_atlas_from_files(filenames, output_dir, size)
+
+
+def write_face(output, pixbuf, x, y, size, rowstride):
+    """Write the size x size RGBA pixbuf at x, y of the atlas pixels in the
+    file output."""
+    pixels = pixbuf.read_pixel_bytes().get_data()
+    stride = pixbuf.get_rowstride()
+    for row in range(size):
+        output.seek(PIXELS_HEADER.size + (y + row) * rowstride + x * 4)
+        output.write(pixels[row * stride:row * stride + size * 4])
+
+
+def build_atlas_from_files(filenames, output_dir, size=90):
+    """Render the images in filenames into an atlas in output_dir. Files
+    that cannot be loaded are recorded as skipped. Safe to call from a
+    worker thread.
+
+    Return the number of faces in the atlas."""
+    from . import pixbufs
+
+    filenames = sorted(set(filenames), key=encode_path)
+    columns = max(1, int(math.ceil(math.sqrt(len(filenames)))))
+    rows = max(1, int(math.ceil(len(filenames) / float(columns))))
+    width = columns * size
+    height = rows * size
+    rowstride = width * 4
+    generation = int.from_bytes(os.urandom(8), 'little')
+
+    # Other instances may be building or reading the atlas too.
+    os.makedirs(output_dir, exist_ok=True)
+    atlas_path = os.path.join(output_dir, ATLAS_FILENAME)
+    index_path = os.path.join(output_dir, INDEX_FILENAME)
+    atlas_temporary = '%s.%i.tmp' % (atlas_path, os.getpid())
+    index_temporary = '%s.%i.tmp' % (index_path, os.getpid())
+
+    # (path, stat, x, y) of each face. Files that vanish have no record.
+    entries = []
+    rendered = 0
+    with open(atlas_temporary, 'wb') as output:
+        output.write(PIXELS_HEADER.pack(PIXELS_MAGIC, generation))
+        output.truncate(PIXELS_HEADER.size + rowstride * height)
+        for filename in filenames:
+            path = encode_path(filename)
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                continue
+            try:
+                pixbuf = pixbufs.load_scaled(filename, size, size)
+            except (GLib.Error, OSError):  # pylint: disable=E0712
+                pixbuf = None
+            if pixbuf is None:
+                x = y = SKIPPED
+            else:
+                if not pixbuf.get_has_alpha():
+                    pixbuf = pixbuf.add_alpha(False, 0, 0, 0)
+                x = (rendered % columns) * size
+                y = (rendered // columns) * size
+                write_face(output, pixbuf, x, y, size, rowstride)
+                rendered += 1
+            entries.append((path, stat, x, y))
+
+    records = []
+    paths = b''
+    paths_offset = HEADER.size + RECORD.size * len(entries)
+    for path, stat, x, y in entries:
+        records.append(RECORD.pack(paths_offset + len(paths), len(path),
+                                   stat.st_mtime_ns, stat.st_size, x, y))
+        paths += path
+    header = HEADER.pack(MAGIC, generation, size, len(records), width, height,
+                         rowstride)
+    with open(index_temporary, 'wb') as output:
+        output.write(header + b''.join(records) + paths)
+
+    os.replace(atlas_temporary, atlas_path)
+    os.replace(index_temporary, index_path)
+    return rendered
+
+
+class FaceAtlas:
+
+    '''
+    A mapped, read-only face atlas. Use FaceAtlas.open() to load one.
+    '''
+
+    def __init__(self, atlas_path, index_path):
+        """Initialize the FaceAtlas. Raises OSError, GLib.Error or ValueError
+        if the atlas is missing or invalid."""
+        with open(index_path, 'rb') as index:
+            self._index = mmap.mmap(index.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, generation, self.size, self.count, width, height, rowstride = \
+            HEADER.unpack_from(self._index, 0)
+        if magic != MAGIC:
+            raise ValueError('%s is not a face atlas index' % index_path)
+
+        # Read the header and map the pixels from the same open file, so
+        # they cannot belong to different generations.
+        with open(atlas_path, 'rb') as atlas:
+            magic, atlas_generation = PIXELS_HEADER.unpack(
+                atlas.read(PIXELS_HEADER.size))
+            if magic != PIXELS_MAGIC or atlas_generation != generation:
+                raise ValueError('%s does not match %s' % (atlas_path,
+                                                           index_path))
+            self._mapped = GLib.MappedFile.new_from_fd(atlas.fileno(), False)
+        length = rowstride * height
+        mapped = self._mapped.get_bytes()
+        if mapped.get_size() < PIXELS_HEADER.size + length:
+            raise ValueError('%s is truncated' % atlas_path)
+
+        # Wrap the mapped pixels without copying them.
+        self._pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(
+            GLib.Bytes.new_from_bytes(mapped, PIXELS_HEADER.size, length),
+            GdkPixbuf.Colorspace.RGB, True, 8, width, height, rowstride)
+
+    @classmethod
+    def open(cls, directory):
+        """Return the FaceAtlas in directory, or None."""
+        try:
+            return cls(os.path.join(directory, ATLAS_FILENAME),
+                       os.path.join(directory, INDEX_FILENAME))
+        except (OSError, ValueError, struct.error,
+                GLib.Error):  # pylint: disable=E0712
+            return None
+
+    def __len__(self):
+        return self.count
+
+    def _get_record(self, index):
+        """Return the path and record at index."""
+        record = RECORD.unpack_from(self._index,
+                                    HEADER.size + index * RECORD.size)
+        path = self._index[record[0]:record[0] + record[1]]
+        return (path, record)
+
+    def _find(self, path):
+        """Binary search for path, return its record or None."""
+        low = 0
+        high = self.count
+        while low < high:
+            middle = (low + high) // 2
+            found, record = self._get_record(middle)
+            if found == path:
+                return record
+            if found < path:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _find_current(self, filename):
+        """Return the record for filename, or None if it is not in the atlas
+        or has changed since the atlas was built."""
+        record = self._find(encode_path(filename))
+        if record is None:
+            return None
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        offset, length, mtime, size, x, y = record
+        if stat.st_mtime_ns != mtime or stat.st_size != size:
+            return None
+        return record
+
+    def lookup(self, filename):
+        """Return the thumbnail for filename, or None if it is not in the
+        atlas or has changed since the atlas was built."""
+        record = self._find_current(filename)
+        if record is None:
+            return None
+        offset, length, mtime, size, x, y = record
+        if x == SKIPPED:
+            return None
+        return self._pixbuf.new_subpixbuf(x, y, self.size, self.size)
+
+    def covers(self, filenames):
+        """Return True if the atlas holds exactly filenames, unchanged,
+        including those that could not be decoded."""
+        if self.count != len(filenames):
+            return False
+        for filename in filenames:
+            if self._find_current(filename) is None:
+                return False
+        return True
+
+
+def main():
+    """Build a face atlas from the command line."""
+    parser = argparse.ArgumentParser(description="Build a Mugshot face atlas")
+    parser.add_argument("--faces-dir", action="append", dest="faces_dirs",
+                        help="directory of stock faces, can be repeated "
+                             "(default: pixmaps/faces in XDG_DATA_DIRS)")
+    parser.add_argument("--output-dir", default=system_cache_dir)
+    parser.add_argument("--size", type=int, default=90)
+    options = parser.parse_args()
+    filenames = []
+    for faces_dir in options.faces_dirs or get_system_faces_dirs():
+        if os.path.isdir(faces_dir):
+            filenames.extend(entry.path for entry in os.scandir(faces_dir)
+                             if entry.is_file())
+    count = build_atlas_from_files(filenames, options.output_dir,
+                                   options.size)
+    print("Built face atlas with %i face(s) in %s" % (count,
+                                                      options.output_dir))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
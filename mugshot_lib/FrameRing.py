@@ -0,0 +1,167 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+gi.require_version('GstVideo', '1.0')
+from gi.repository import GLib, Gst, GstVideo  # nopep8
+
+from . import capture, imaging, pixbufs  # nopep8
+
+logger = logging.getLogger('mugshot_lib')
+
+
+class FrameRing:
+
+    '''
+    Keeps copies of the most recent frames reaching a pad, so a photo can be
+    taken from the frame that was on screen when the user clicked instead of
+    waiting for a new one.
+
+    Frames are copied into a fixed number of buffers allocated when the
+    first frame (or a frame with new caps) arrives, and reused from then on.
+
+    Keyword arguments:
+    - slots: Number of frames kept.
+    - clock: Optional function returning the current time in seconds.
+    '''
+
+    def __init__(self, slots=8, clock=time.monotonic):
+        """Initialize the FrameRing."""
+        self.clock = clock
+        self._slots = [None] * slots
+        self._times = [None] * slots
+        self._caps = None
+        self._next = 0
+        self._lock = threading.Lock()
+        self._pad = None
+        self._probe_id = None
+        # Frames seen since the ring was created.
+        self.frame_count = 0
+        self._waiting = []
+
+    def attach(self, pad):
+        """Start copying the buffers flowing through pad."""
+        self.detach()
+        self._pad = pad
+        self._probe_id = pad.add_probe(Gst.PadProbeType.BUFFER,
+                                       self._on_buffer)
+
+    def detach(self):
+        """Stop copying buffers and forget the buffered frames."""
+        if self._pad is not None:
+            self._pad.remove_probe(self._probe_id)
+            self._pad = None
+            self._probe_id = None
+        self.clear()
+
+    def clear(self):
+        """Forget the buffered frames, keeping the buffers for reuse."""
+        with self._lock:
+            self._times = [None] * len(self._slots)
+
+    def _on_buffer(self, pad, info):
+        """Copy a buffer into the next slot. Called from the streaming
+        thread."""
+        buffer = info.get_buffer()
+        caps = pad.get_current_caps()
+        size = buffer.get_size()
+        with self._lock:
+            if caps is not None and (self._caps is None or
+                                     not caps.is_equal(self._caps)):
+                # New caps, the old frames can no longer be decoded.
+                self._caps = caps
+                self._times = [None] * len(self._slots)
+            slot = self._slots[self._next]
+            if slot is None or len(slot) != size:
+                slot = bytearray(size)
+                self._slots[self._next] = slot
+            success, mapped = buffer.map(Gst.MapFlags.READ)
+            if success:
+                slot[:] = mapped.data
+                buffer.unmap(mapped)
+                self._times[self._next] = self.clock()
+                self._next = (self._next + 1) % len(self._slots)
+            self.frame_count += 1
+            waiting = self._waiting
+            self._waiting = []
+        for callback in waiting:
+            GLib.idle_add(callback, self.clock())
+        return Gst.PadProbeReturn.OK
+
+    def notify_next(self, callback):
+        """Call callback(time) on the main thread once the next frame has
+        arrived."""
+        with self._lock:
+            self._waiting.append(callback)
+
+    def get_frames(self, before=None, count=1):
+        """Return up to count (time, data, caps) frames, newest first, taken
+        no later than before (default: now)."""
+        if before is None:
+            before = self.clock()
+        with self._lock:
+            frames = [(self._times[index], bytes(self._slots[index]),
+                       self._caps)
+                      for index in range(len(self._slots))
+                      if self._times[index] is not None and
+                      self._times[index] <= before]
+        frames.sort(key=lambda frame: frame[0], reverse=True)
+        return frames[:count]
+
+    def to_pixbuf(self, frame):
+        """Convert a frame from get_frames() to a pixbuf, or None."""
+        frame_time, data, caps = frame
+        sample = Gst.Sample.new(Gst.Buffer.new_wrapped(data), caps, None,
+                                None)
+        try:
+            converted = GstVideo.video_convert_sample(
+                sample, Gst.Caps.from_string(capture.pixbuf_caps),
+                Gst.SECOND)
+        except GLib.Error:  # pylint: disable=E0712
+            logger.debug('Unable to convert a buffered frame.')
+            return None
+        return capture.sample_to_pixbuf(converted)
+
+    def get_pixbuf(self, before=None, burst=1):
+        """Return the frame shown at time before (default: now) as a pixbuf,
+        or None if no frame has been buffered. With burst > 1 and NumPy
+        available, the sharpest of the last burst frames is returned."""
+        frames = self.get_frames(before, burst)
+        if not frames:
+            return None
+        if len(frames) == 1 or not imaging.has_numpy():
+            return self.to_pixbuf(frames[0])
+
+        best = None
+        best_score = None
+        for frame in frames:
+            pixbuf = self.to_pixbuf(frame)
+            if pixbuf is None:
+                continue
+            score = imaging.get_sharpness(pixbufs.pixbuf_to_array(pixbuf))
+            if best_score is None or score > best_score:
+                best = pixbuf
+                best_score = score
+        logger.debug('Picked the sharpest of %i frames (%.1f)' %
+                     (len(frames), best_score or 0))
+        return best
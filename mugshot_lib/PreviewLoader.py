@@ -0,0 +1,156 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import os
+import queue
+import threading
+
+from collections import OrderedDict
+
+from gi.repository import GLib, GObject  # pylint: disable=E0611
+
+from . import pixbufs
+
+logger = logging.getLogger('mugshot_lib')
+
+
+def get_cache_key(filename):
+    """Return the (path, mtime, size) cache key for filename, or None if the
+    file cannot be accessed."""
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return (filename, stat.st_mtime, stat.st_size)
+
+
+class PixbufCache:
+
+    """Least recently used cache of decoded pixbufs."""
+
+    def __init__(self, max_items=16):
+        """Initialize the PixbufCache."""
+        self._items = OrderedDict()
+        self.max_items = max_items
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key):
+        """Return the cached pixbuf for key, or None."""
+        if key not in self._items:
+            return None
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def put(self, key, pixbuf):
+        """Store pixbuf for key, evicting the least recently used items."""
+        self._items[key] = pixbuf
+        self._items.move_to_end(key)
+        while len(self._items) > self.max_items:
+            self._items.popitem(last=False)
+
+    def clear(self):
+        """Remove all of the cached pixbufs."""
+        self._items.clear()
+
+
+class PreviewLoader(GObject.GObject):
+
+    '''
+    Decodes preview images in a worker thread.
+
+    Requests are debounced, so rapidly changing the selection only decodes
+    the file that was selected last, and results for stale requests are
+    dropped. Decoded images are reduced to fit min_side and kept in an LRU
+    cache keyed by (path, mtime, size).
+
+    Signals:
+    - preview-loaded: (filename, pixbuf), pixbuf is None if loading failed.
+    '''
+    __gsignals__ = {
+        'preview-loaded': (GObject.SIGNAL_RUN_LAST,
+                           GObject.TYPE_NONE,
+                           (GObject.TYPE_STRING, GObject.TYPE_PYOBJECT))
+    }
+
+    def __init__(self, min_side=256, delay=100, cache_size=16):
+        """Initialize the PreviewLoader."""
+        GObject.GObject.__init__(self)
+        self.min_side = min_side
+        self.delay = delay
+        self.cache = PixbufCache(cache_size)
+
+        self._generation = 0
+        self._timeout = None
+        self._queue = queue.Queue()
+        self._thread = None
+
+    def lookup(self, filename):
+        """Return the cached preview for filename, or None."""
+        key = get_cache_key(filename)
+        if key is None:
+            return None
+        return self.cache.get(key)
+
+    def request(self, filename):
+        """Request a preview for filename, cancelling any pending requests.
+        The preview-loaded signal is emitted when it is available."""
+        self.cancel()
+        self._timeout = GLib.timeout_add(self.delay, self._on_timeout,
+                                         filename, self._generation)
+
+    def cancel(self):
+        """Cancel any pending requests."""
+        self._generation += 1
+        if self._timeout is not None:
+            GLib.source_remove(self._timeout)
+            self._timeout = None
+
+    def _on_timeout(self, filename, generation):
+        """Pass the debounced request to the worker thread."""
+        self._timeout = None
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        self._queue.put((generation, filename))
+        return False
+
+    def _run(self):
+        """Worker thread, decode requested files that are still current."""
+        while True:
+            generation, filename = self._queue.get()
+            if generation != self._generation:
+                continue
+            key = get_cache_key(filename)
+            pixbuf = None
+            if key is not None:
+                try:
+                    pixbuf = pixbufs.load_pixbuf(filename, self.min_side)
+                except (GLib.Error, OSError):  # pylint: disable=E0712
+                    logger.debug('Unable to load preview for %s' % filename)
+            GLib.idle_add(self._on_loaded, generation, filename, key, pixbuf)
+
+    def _on_loaded(self, generation, filename, key, pixbuf):
+        """Cache the decoded pixbuf and emit it if it is still current."""
+        if pixbuf is not None:
+            self.cache.put(key, pixbuf)
+        if generation == self._generation:
+            self.emit('preview-loaded', filename, pixbuf)
+        return False
@@ -0,0 +1,344 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Persistent privileged helper for batched account edits.
+
+The helper is started once per Apply (as root, through sudo) and listens on a
+private Unix socket. Mugshot sends a whole batch of GECOS edits in a single
+newline-delimited JSON message and receives the per-field results back:
+
+    -> {"command": "apply", "edits": {"full_name": "Jane Doe"}}
+    <- {"results": {"full_name": true}}
+    -> {"command": "quit"}
+    <- {"results": {}}
+
+Starting the helper takes a sudo command of its own, so it only saves forks
+when a batch holds more than one edit. Mugshot runs a single edit (as with
+root_fields below, only the full name) with one 'sudo -n chfn' instead.
+
+When run with --mock, no commands are executed and every edit is reported as
+successful. This allows exercising the protocol without root privileges.
+
+The server half of this module only depends on the standard library. It is
+installed as a script at a fixed path (see mugshotconfig.get_helper_path()),
+which is what sudo runs. The copy of this module next to the client is only
+ever run unprivileged, in mock mode.'''
+
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+
+logger = logging.getLogger('mugshot_lib')
+
+READY = "MUGSHOT-HELPER-READY"
+
+# chfn arguments used for each of the supported fields. Alternatives are tried
+# in order; chfn 2.29 uses "-p" for the office phone (LP: #1699285), others
+# use "-w".
+chfn_fields = {
+    'full_name': [['-f']],
+    'home_phone': [['-h']],
+    'office_phone': [['-p'], ['-w']],
+}
+
+# Fields only root may change, the only ones the helper accepts. The others
+# are changed by the user, so chfn applies CHFN_RESTRICT to them.
+root_fields = ['full_name']
+
+
+# = Server =============================================================== #
+def apply_edits(username, edits, mock=False):
+    """Apply a dictionary of field: value edits with chfn, return a dictionary
+    of field: success."""
+    results = {}
+    chfn = shutil.which('chfn')
+    for field, value in edits.items():
+        if field not in root_fields or not isinstance(value, str):
+            results[field] = False
+            continue
+        if mock:
+            results[field] = True
+            continue
+        results[field] = False
+        if chfn is None:
+            continue
+        for flags in chfn_fields[field]:
+            command = [chfn] + flags + [value, username]
+            if subprocess.call(command, stdin=subprocess.DEVNULL,
+                               stdout=subprocess.DEVNULL,
+                               stderr=subprocess.DEVNULL) == 0:
+                results[field] = True
+                break
+    return results
+
+
+def is_trusted(path):
+    """Return True if path is a file that only root can modify, in a
+    directory that only root can modify."""
+    for checked in [os.path.dirname(path), path]:
+        try:
+            info = os.stat(checked)
+        except OSError:
+            return False
+        if info.st_uid != 0 or info.st_mode & 0o022:
+            return False
+    return os.path.isfile(path)
+
+
+def get_peer_uid(connection):
+    """Return the uid of the process connected to the socket."""
+    creds = connection.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED,
+                                  struct.calcsize('3i'))
+    pid, uid, gid = struct.unpack('3i', creds)
+    return uid
+
+
+def is_same_file(path, info):
+    """Return True if path, not following symlinks, is still the file info
+    was taken from."""
+    try:
+        current = os.lstat(path)
+    except OSError:
+        return False
+    return (current.st_dev, current.st_ino) == (info.st_dev, info.st_ino)
+
+
+def create_socket(socket_path, client_uid):
+    """Create and bind the server socket at socket_path. Return a tuple of
+    (socket, its lstat), or (None, None).
+
+    The socket is created in a new directory of the client, which it could
+    replace the socket with a symlink or a link to another file at any time.
+    So nothing that is already there is removed, and the socket is never
+    chmod-ed or chown-ed by path: it is created world-connectable (sockets
+    need write permission to connect) but owned by root. The directory only
+    lets the client in, and serve() checks the uid of the peer."""
+    try:
+        directory = os.lstat(os.path.dirname(socket_path))
+    except OSError:
+        return (None, None)
+    if not stat.S_ISDIR(directory.st_mode) or \
+            directory.st_uid != client_uid or directory.st_mode & 0o077:
+        logger.debug('Refusing to create a socket in %s' %
+                     os.path.dirname(socket_path))
+        return (None, None)
+    if os.path.lexists(socket_path):
+        logger.debug('Refusing to replace %s' % socket_path)
+        return (None, None)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o111)
+    try:
+        server.bind(socket_path)
+        # Make sure what is at socket_path is the socket bound just now.
+        created = os.lstat(socket_path)
+    except OSError:
+        server.close()
+        return (None, None)
+    finally:
+        os.umask(umask)
+    if not stat.S_ISSOCK(created.st_mode) or \
+            created.st_uid != os.geteuid():
+        server.close()
+        return (None, None)
+    return (server, created)
+
+
+def serve(socket_path, username, mock=False, timeout=30):
+    """Serve a single client on socket_path, return the exit status."""
+    # Only the user that invoked sudo may connect, and only edit themselves.
+    client_uid = int(os.environ.get('SUDO_UID', os.getuid()))
+    sudo_user = os.environ.get('SUDO_USER', None)
+    if sudo_user is not None and sudo_user != username:
+        return 1
+
+    server, created = create_socket(socket_path, client_uid)
+    if server is None:
+        return 1
+    server.listen(1)
+    server.settimeout(timeout)
+
+    print(READY, flush=True)
+
+    connection = None
+    try:
+        connection, address = server.accept()
+        connection.settimeout(timeout)
+        if get_peer_uid(connection) not in [client_uid, 0]:
+            return 1
+        reader = connection.makefile('r')
+        writer = connection.makefile('w')
+        for line in reader:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = {}
+            command = request.get('command', None)
+            if command == 'apply':
+                edits = request.get('edits', {})
+                results = apply_edits(username, edits, mock)
+            else:
+                results = {}
+            writer.write(json.dumps({'results': results}) + "\n")
+            writer.flush()
+            if command != 'apply':
+                break
+    except (OSError, socket.timeout):
+        return 1
+    finally:
+        if connection is not None:
+            connection.close()
+        server.close()
+        if is_same_file(socket_path, created):
+            os.unlink(socket_path)
+    return 0
+
+
+# = Client =============================================================== #
+class PrivilegedHelper:
+
+    '''
+    Client for the privileged helper.
+
+    Keyword arguments:
+    - username: The user whose details are being edited.
+    - mock:     Run the helper unprivileged, without executing any commands.
+    '''
+
+    def __init__(self, username, mock=False):
+        """Initialize the PrivilegedHelper."""
+        self._username = username
+        self._mock = mock
+        self._child = None
+        self._socket = None
+        self._reader = None
+        self._writer = None
+        self._socket_dir = None
+
+    def start(self, session=None, timeout=10):
+        '''
+        Start the helper and connect to it. Unless mocked, the installed
+        helper is started as root through the validated SudoSession, and
+        only if no one but root can modify it.
+
+        Return True if successful.
+        '''
+        # Imported here, the helper itself only uses the standard library.
+        import pexpect
+        from . mugshotconfig import get_helper_path
+
+        if self._mock:
+            # Unprivileged, this module can run itself.
+            command = [sys.executable, os.path.abspath(__file__)]
+        else:
+            helper = get_helper_path()
+            if session is None or helper is None or not is_trusted(helper):
+                logger.debug('No trusted privileged helper installed.')
+                return False
+            command = [helper]
+
+        self._socket_dir = tempfile.mkdtemp(prefix='mugshot-')
+        socket_path = os.path.join(self._socket_dir, 'helper')
+        args = command + ['--socket', socket_path, '--user', self._username]
+
+        if self._mock:
+            args.append('--mock')
+            child = pexpect.spawn(args[0], args[1:], timeout=timeout)
+            try:
+                child.expect(READY)
+            except pexpect.ExceptionPexpect:
+                child.close(True)
+                child = None
+        else:
+            child = session.spawn(args, READY, timeout)
+
+        if child is None:
+            logger.debug('Privileged helper failed to start.')
+            self.stop()
+            return False
+        self._child = child
+
+        try:
+            self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self._socket.settimeout(timeout)
+            self._socket.connect(socket_path)
+        except OSError:
+            logger.debug('Unable to connect to the privileged helper.')
+            self.stop()
+            return False
+        self._reader = self._socket.makefile('r')
+        self._writer = self._socket.makefile('w')
+        return True
+
+    def _request(self, request):
+        """Send a request to the helper, return the results dictionary."""
+        try:
+            self._writer.write(json.dumps(request) + "\n")
+            self._writer.flush()
+            response = json.loads(self._reader.readline())
+        except (OSError, ValueError, AttributeError):
+            return None
+        return response.get('results', None)
+
+    def apply(self, edits):
+        '''
+        Send a batch of field: value edits to the helper.
+
+        Return a dictionary of field: success, or None on failure.
+        '''
+        logger.debug('Sending %i edit(s) to the privileged helper.' %
+                     len(edits))
+        return self._request({'command': 'apply', 'edits': edits})
+
+    def stop(self):
+        """Ask the helper to quit and clean up."""
+        if self._writer is not None:
+            self._request({'command': 'quit'})
+        if self._socket is not None:
+            self._socket.close()
+        if self._child is not None:
+            self._child.close(True)
+        if self._socket_dir is not None:
+            shutil.rmtree(self._socket_dir, ignore_errors=True)
+        self._child = None
+        self._socket = None
+        self._reader = None
+        self._writer = None
+        self._socket_dir = None
+
+
+def main():
+    """Run the helper server."""
+    parser = argparse.ArgumentParser(description="Mugshot privileged helper")
+    parser.add_argument("--socket", required=True)
+    parser.add_argument("--user", required=True)
+    parser.add_argument("--mock", action="store_true")
+    options = parser.parse_args()
+    return serve(options.socket, options.user, options.mock)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -16,13 +16,17 @@
 #   You should have received a copy of the GNU General Public License along
 #   with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import logging
 import os
+import subprocess
 from locale import gettext as _
 
 from gi.repository import Gtk, GdkPixbuf
 
 import pexpect
 
+logger = logging.getLogger('mugshot_lib')
+
 gtk_version = (Gtk.get_major_version(),
                Gtk.get_minor_version(),
                Gtk.get_micro_version())
@@ -95,13 +99,155 @@ def env_spawn(command, args, timeout):
     return child
 
 
+# Error of 'sudo -n' without a usable timestamp, in the C locale.
+password_required = "a password is required"
+
+# Prompt given to sudo when its password prompt has to be answered.
+sudo_prompt = "[mugshot] sudo password: "
+
+
+class SudoSession:
+
+    '''
+    Reuses a validated sudo credential for subsequent privileged commands.
+
+    The password is verified once with 'sudo -S -v', which also refreshes the
+    sudo timestamp. Later commands are run directly with 'sudo -n' against
+    that timestamp. Only if sudo fails because a password is required (e.g.
+    when timestamp_timeout is 0) is the command retried with the password
+    sent on stdin ('sudo -S').
+
+    Commands that do not need root are run as the user with run_as_user(),
+    which answers their password prompt with the same password.
+    '''
+
+    def __init__(self):
+        """Initialize the SudoSession."""
+        self._password = None
+        self.validated = False
+
+    def _sudo(self, args, password=None, timeout=5):
+        """Run sudo with args, return a tuple of (exit status, stderr)."""
+        sudo = pexpect.which("sudo")
+        if sudo is None:
+            return (-1, "")
+        env = os.environ.copy()
+        env["LC_ALL"] = "C"
+        if password is not None:
+            password = password + "\n"
+        try:
+            result = subprocess.run([sudo] + args, input=password,
+                                    stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE,
+                                    universal_newlines=True,
+                                    env=env, timeout=timeout)
+        except (OSError, subprocess.TimeoutExpired):
+            return (-1, "")
+        return (result.returncode, result.stderr)
+
+    def validate(self, password):
+        '''
+        Verify the password and refresh the sudo timestamp.
+
+        Return True if successful.
+        '''
+        status, error = self._sudo(["-S", "-p", "", "-v"], password)
+        self.validated = status == 0
+        if self.validated:
+            self._password = password
+        else:
+            self._password = None
+        return self.validated
+
+    def run(self, args, timeout=5):
+        '''
+        Run the command described by args as root.
+
+        Return True if the command exited successfully.
+        '''
+        if not self.validated:
+            return False
+        logger.debug('Executing: %s' % " ".join(args))
+        status, error = self._sudo(["-n", "--"] + args, timeout=timeout)
+        if status != 0 and password_required in error:
+            # No usable timestamp, retry sending the password. It is sent
+            # with the command itself, as with timestamp_timeout set to 0 a
+            # 'sudo -S -v' would not leave a timestamp to retry with.
+            logger.debug('sudo timestamp unavailable, resending password.')
+            status, error = self._sudo(["-S", "-p", "", "--"] + args,
+                                       self._password, timeout)
+        return status == 0
+
+    def run_as_user(self, args, timeout=5):
+        '''
+        Run the command described by args as the current user, answering its
+        password prompt (e.g. from chfn) with the validated password.
+
+        Return True if the command exited successfully.
+        '''
+        if not self.validated:
+            return False
+        logger.debug('Executing: %s' % " ".join(args))
+        # Force the C locale for guaranteed english prompts.
+        env = os.environ.copy()
+        env["LC_ALL"] = "C"
+        try:
+            child = pexpect.spawn(args[0], args[1:], env=env,
+                                  timeout=timeout)
+        except pexpect.ExceptionPexpect:
+            return False
+        try:
+            if child.expect([".*ssword.*", pexpect.EOF]) == 0:
+                child.sendline(self._password)
+                child.expect(pexpect.EOF)
+        except pexpect.TIMEOUT:
+            logger.warning('Timeout reached, password was likely incorrect.')
+        child.close(True)
+        return child.exitstatus == 0
+
+    def spawn(self, args, ready, timeout=5):
+        '''
+        Spawn the command described by args as root, answering the password
+        prompt if sudo asks for one. sudo is given a fixed prompt, so it is
+        recognized whatever the locale or the sudoers configuration.
+
+        Return the pexpect child once ready has been matched, or None.
+        '''
+        if not self.validated:
+            return None
+        sudo = pexpect.which("sudo")
+        if sudo is None:
+            return None
+        env = os.environ.copy()
+        env["LC_ALL"] = "C"
+        try:
+            child = pexpect.spawn(sudo, ["-p", sudo_prompt, "--"] + args,
+                                  env=env, timeout=timeout)
+        except pexpect.ExceptionPexpect:
+            return None
+        try:
+            if child.expect_exact([sudo_prompt, ready]) == 0:
+                child.sendline(self._password)
+                child.expect_exact(ready)
+        except (pexpect.EOF, pexpect.TIMEOUT):
+            child.close(True)
+            return None
+        return child
+
+    def close(self):
+        """Forget the stored password."""
+        self._password = None
+        self.validated = False
+
+
 class SudoDialog(Gtk.Dialog):
 
     '''
     Creates a new SudoDialog. This is a replacement for using gksudo which
     provides additional flexibility when performing sudo commands.
 
-    Only used to verify password by issuing 'sudo /bin/true'.
+    Verifies the password with a SudoSession, which can then be retrieved
+    with get_session() to run privileged commands.
 
     Keyword arguments:
     - parent:   Optional parent Gtk.Window
@@ -220,6 +366,8 @@ class SudoDialog(Gtk.Dialog):
         self.attempted_logins = 0
         self.max_attempted_logins = retries
 
+        self.session = SudoSession()
+
         self.show_all()
 
     def on_password_changed(self, widget, button):
@@ -297,6 +445,12 @@ class SudoDialog(Gtk.Dialog):
             return None
         return password
 
+    def get_session(self):
+        '''Return the validated SudoSession, or None if not validated.'''
+        if not self.password_valid or not self.session.validated:
+            return None
+        return self.session
+
     def set_password(self, text=None):
         '''Set the password entry to the defined text.'''
         if text is None:
@@ -310,20 +464,7 @@ class SudoDialog(Gtk.Dialog):
 
         Return True if successful.
         '''
-        # Set the pexpect variables and spawn the process.
-        child = env_spawn('sudo', ['/bin/true'], 1)
-        try:
-            # Check for password prompt or program exit.
-            child.expect([".*ssword.*", pexpect.EOF])
-            child.sendline(self.password_entry.get_text())
-            child.expect(pexpect.EOF)
-        except pexpect.TIMEOUT:
-            # If we timeout, that means the password was unsuccessful.
-            pass
-        # Close the child process if it is still open.
-        child.close()
-        # Exit status 0 means success, anything else is an error.
-        if child.exitstatus == 0:
+        if self.session.validate(self.password_entry.get_text()):
             self.attempted_logins = 0
             return True
         self.attempted_logins += 1
@@ -0,0 +1,106 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+
+from collections import deque
+
+from gi.repository import GLib, GObject  # pylint: disable=E0611
+
+from . import pixbufs
+
+logger = logging.getLogger('mugshot_lib')
+
+
+class ThumbnailLoader(GObject.GObject):
+
+    '''
+    Loads square thumbnails in a worker thread.
+
+    Files are processed in the order they were requested. To load other
+    files first (e.g. the rows currently on screen), cancel() the pending
+    requests and request() them again in the new order.
+
+    Keyword arguments:
+    - size:  Width and height of the thumbnails.
+    - cache: Optional ThumbnailCache checked before decoding.
+
+    Signals:
+    - thumbnail-loaded: (filename, pixbuf), pixbuf is None if loading failed.
+    '''
+    __gsignals__ = {
+        'thumbnail-loaded': (GObject.SIGNAL_RUN_LAST,
+                             GObject.TYPE_NONE,
+                             (GObject.TYPE_STRING, GObject.TYPE_PYOBJECT))
+    }
+
+    def __init__(self, size=90, cache=None):
+        """Initialize the ThumbnailLoader."""
+        GObject.GObject.__init__(self)
+        self.size = size
+        self.cache = cache
+
+        self._pending = deque()
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def request(self, filenames):
+        """Queue filenames to be loaded."""
+        with self._condition:
+            self._pending.extend(filenames)
+            self._condition.notify()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def cancel(self):
+        """Remove all pending requests."""
+        with self._condition:
+            self._pending.clear()
+
+    def load(self, filename):
+        """Return the thumbnail for filename, or None. Called from the worker
+        thread."""
+        if self.cache is not None:
+            pixbuf = self.cache.lookup(filename)
+            if pixbuf is not None:
+                return pixbuf
+        try:
+            pixbuf = pixbufs.load_scaled(filename, self.size, self.size)
+        except (GLib.Error, OSError):  # pylint: disable=E0712
+            logger.debug('Unable to load thumbnail for %s' % filename)
+            return None
+        if self.cache is not None:
+            self.cache.store(filename, pixbuf)
+        return pixbuf
+
+    def _run(self):
+        """Worker thread, load each pending file in turn."""
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                filename = self._pending.popleft()
+            pixbuf = self.load(filename)
+            GLib.idle_add(self._on_loaded, filename, pixbuf)
+
+    def _on_loaded(self, filename, pixbuf):
+        """Emit the loaded thumbnail on the main thread."""
+        self.emit('thumbnail-loaded', filename, pixbuf)
+        return False
@@ -18,8 +18,9 @@
 
 import os
 import logging
+import time
 
-from gi.repository import Gio, Gtk  # pylint: disable=E0611
+from gi.repository import Gio, GLib, Gtk  # pylint: disable=E0611
 
 from . helpers import get_builder, show_uri
 
@@ -65,6 +66,8 @@ class Window(Gtk.Window):
         self.ui = builder.get_ui(self, True)
         self.CameraDialog = None  # class
         self.camera_dialog = None  # instance
+        self._prewarm_id = None
+        self._cancel_prewarm_id = None
 
         self.settings = Gio.Settings.new("org.bluesabre.mugshot")
         self.settings.connect('changed', self.on_preferences_changed)
@@ -75,17 +78,79 @@ class Window(Gtk.Window):
         """Show the Help documentation when Help is clicked."""
         show_uri(self, "https://github.com/bluesabre/mugshot/wiki")
 
-    def on_menu_camera_activate(self, widget, data=None):
-        """Display the camera window for mugshot."""
-        if self.camera_dialog is not None:
-            logger.debug('show existing camera_dialog')
-            self.camera_dialog.show()
-        elif self.CameraDialog is not None:
+    def get_camera_dialog(self):
+        """Return the camera dialog, creating it if needed, or None if there
+        is no camera support."""
+        if self.camera_dialog is None and self.CameraDialog is not None:
             logger.debug('create new camera_dialog')
             self.camera_dialog = self.CameraDialog()  # pylint: disable=E1102
             self.camera_dialog.connect(
                 'apply', self.on_camera_dialog_apply)  # pylint: disable=E1101
-            self.camera_dialog.show()
+        return self.camera_dialog
+
+    def probe_camera(self):
+        """List the cameras in a worker thread, so the camera dialog does not
+        have to wait for them on the main thread."""
+        if self.CameraDialog is not None:
+            self.CameraDialog.probe_devices()
+
+    def prewarm_camera(self):
+        """Create the camera dialog and open the camera, without streaming,
+        once the main loop is idle, so the preview is live sooner if the
+        dialog is opened."""
+        if self.CameraDialog is None or self._prewarm_id is not None:
+            return
+        if self._cancel_prewarm_id is not None:
+            GLib.source_remove(self._cancel_prewarm_id)
+            self._cancel_prewarm_id = None
+        self._prewarm_id = GLib.idle_add(self._on_prewarm_camera)
+
+    def _on_prewarm_camera(self):
+        """Open the camera without showing the dialog."""
+        self._prewarm_id = None
+        started = time.monotonic()
+        dialog = self.get_camera_dialog()
+        if not dialog.get_visible():
+            dialog.prewarm()
+        logger.debug('Camera pre-warmed in %.0f ms' %
+                     ((time.monotonic() - started) * 1000))
+        return False
+
+    def cancel_camera_prewarm(self):
+        """Stop the pre-warmed camera unless the dialog is opened. Menus hide
+        before the chosen item is activated, so this waits for the main loop
+        to give on_menu_camera_activate() a chance to keep it."""
+        if self._cancel_prewarm_id is None:
+            self._cancel_prewarm_id = GLib.idle_add(
+                self._on_cancel_camera_prewarm)
+
+    def _on_cancel_camera_prewarm(self):
+        """Drop a pending pre-warm, or release the pre-warmed camera soon."""
+        self._cancel_prewarm_id = None
+        if self._prewarm_id is not None:
+            GLib.source_remove(self._prewarm_id)
+            self._prewarm_id = None
+        elif self.camera_dialog is not None and \
+                not self.camera_dialog.get_visible():
+            logger.debug('Camera pre-warm cancelled')
+            self.camera_dialog.cancel_prewarm()
+        return False
+
+    def on_menu_camera_activate(self, widget, data=None):
+        """Display the camera window for mugshot."""
+        requested = time.monotonic()
+        if self._cancel_prewarm_id is not None:
+            GLib.source_remove(self._cancel_prewarm_id)
+            self._cancel_prewarm_id = None
+        if self._prewarm_id is not None:
+            GLib.source_remove(self._prewarm_id)
+            self._prewarm_id = None
+        if self.camera_dialog is not None:
+            logger.debug('show existing camera_dialog')
+        dialog = self.get_camera_dialog()
+        if dialog is not None:
+            dialog.requested_at = requested
+            dialog.show()
 
     def on_destroy(self, widget, data=None):
         """Called when the MugshotWindow is closed."""
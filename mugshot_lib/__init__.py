@@ -18,9 +18,25 @@
 
 '''facade - makes mugshot_lib package easy to refactor
 
-while keeping its api constant'''
-# lint:disable
-from . helpers import set_up_logging
-from . Window import Window
-from . mugshotconfig import get_version
-# lint:enable
+while keeping its api constant
+
+The names are imported when first used, so modules that do not need GTK
+(e.g. imaging) can be imported without it.'''
+import importlib
+
+# Facade names, and the modules defining them.
+_facade = {'set_up_logging': 'helpers',
+           'Window': 'Window',
+           'get_version': 'mugshotconfig'}
+
+
+def __getattr__(name):
+    """Import a facade name the first time it is used."""
+    if name not in _facade:
+        raise AttributeError("module %r has no attribute %r" %
+                             (__name__, name))
+    value = getattr(importlib.import_module('.' + _facade[name], __name__),
+                    name)
+    # Importing the Window module set the package attribute to the module.
+    globals()[name] = value
+    return value
@@ -0,0 +1,299 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Camera format negotiation, state tracking and headless capture,
+independent of Cheese, Clutter and GTK."""
+
+import logging
+import os
+import time
+
+import gi
+gi.require_version('Gst', '1.0')
+from gi.repository import GdkPixbuf, GLib, Gst  # nopep8
+
+from . import imaging, pixbufs  # nopep8
+
+logger = logging.getLogger('mugshot_lib')
+
+# Frames are converted to this format for GdkPixbuf.
+pixbuf_caps = 'video/x-raw,format=RGB,pixel-aspect-ratio=1/1'
+
+# Camera power states.
+# PLAYING:  streaming to the preview.
+# PAUSED:   frozen on the last frame, the device is still open.
+# RELEASED: the device is closed.
+PLAYING = 'playing'
+PAUSED = 'paused'
+RELEASED = 'released'
+
+
+class CaptureError(Exception):
+
+    """Raised when a headless capture fails."""
+
+
+def get_caps_formats(caps):
+    """Return the (width, height) of the raw video formats in caps, without
+    repeats. Structures with size ranges are skipped."""
+    formats = []
+    if caps is None:
+        return formats
+    for index in range(caps.get_size()):
+        structure = caps.get_structure(index)
+        if structure.get_name() != 'video/x-raw':
+            continue
+        has_width, width = structure.get_int('width')
+        has_height, height = structure.get_int('height')
+        if has_width and has_height and (width, height) not in formats:
+            formats.append((width, height))
+    return formats
+
+
+def get_device_node(device):
+    """Return the device node of a Gst.Device, or None."""
+    properties = device.get_properties()
+    if properties is None:
+        return None
+    for key in ['device.path', 'api.v4l2.path']:
+        node = properties.get_string(key)
+        if node:
+            return node
+    return None
+
+
+def get_video_devices():
+    """Return the video sources found by a Gst.DeviceMonitor as a list of
+    (node, formats), e.g. [('/dev/video0', [(640, 480), (1280, 720)])]."""
+    monitor = Gst.DeviceMonitor.new()
+    monitor.add_filter("Video/Source", None)
+    if not monitor.start():
+        return []
+    devices = []
+    for device in monitor.get_devices():
+        node = get_device_node(device)
+        if node and node not in [known[0] for known in devices]:
+            devices.append((node, get_caps_formats(device.get_caps())))
+    monitor.stop()
+    return devices
+
+
+def choose_device(nodes, preferred=None):
+    """Return the device node to open: preferred if it is connected,
+    otherwise the first of nodes, or None if there are none."""
+    if preferred and preferred in nodes:
+        return preferred
+    if nodes:
+        return nodes[0]
+    return None
+
+
+def choose_format(formats, size):
+    """Return the cheapest of formats, a list of (width, height), that still
+    covers a size x size square: the one with the fewest pixels, preferring
+    the squarest on a tie. If none is large enough, return the largest.
+    Return None if formats is empty."""
+    if not formats:
+        return None
+    covering = [(width, height) for width, height in formats
+                if min(width, height) >= size]
+    if not covering:
+        return max(formats, key=lambda fmt: (min(fmt), fmt[0] * fmt[1]))
+    return min(covering, key=lambda fmt: (fmt[0] * fmt[1],
+                                          abs(fmt[0] - fmt[1])))
+
+
+def get_crop_margins(width, height, style=imaging.CROP_CENTER):
+    """Return the (top, bottom, left, right) pixels to remove from a width x
+    height frame to leave the square from imaging.get_crop_box()."""
+    x, y, crop_width, crop_height = imaging.get_crop_box(width, height, style)
+    return (y, height - y - crop_height, x, width - x - crop_width)
+
+
+def get_output_size(width, height, size):
+    """Return the side of the square produced from a width x height frame for
+    a size x size target. Frames are never scaled up."""
+    return min(size, width, height)
+
+
+def get_filter_description(width, height, size):
+    """Return a GStreamer bin description that crops width x height frames to
+    a square and scales it to get_output_size()."""
+    top, bottom, left, right = get_crop_margins(width, height)
+    side = get_output_size(width, height, size)
+    return ("videocrop top=%i bottom=%i left=%i right=%i ! videoscale ! "
+            "video/x-raw,width=%i,height=%i,pixel-aspect-ratio=1/1" %
+            (top, bottom, left, right, side, side))
+
+
+class StateTimer:
+
+    '''
+    Tracks the camera power state and the time spent in each state.
+
+    Keyword arguments:
+    - state: The initial state.
+    - clock: Optional function returning the current time in seconds.
+    '''
+
+    def __init__(self, state=RELEASED, clock=time.monotonic):
+        """Initialize the StateTimer."""
+        self.clock = clock
+        self.state = state
+        self._since = clock()
+        self._durations = {PLAYING: 0.0, PAUSED: 0.0, RELEASED: 0.0}
+
+    def set_state(self, state):
+        """Enter state. Return the seconds spent in the previous state."""
+        now = self.clock()
+        elapsed = now - self._since
+        self._durations[self.state] += elapsed
+        if state != self.state:
+            logger.debug('Camera %s -> %s after %.2fs' % (self.state, state,
+                                                          elapsed))
+        self.state = state
+        self._since = now
+        return elapsed
+
+    def get_durations(self):
+        """Return a dictionary of the seconds spent in each state, including
+        the current one."""
+        durations = dict(self._durations)
+        durations[self.state] += self.clock() - self._since
+        return durations
+
+    def get_summary(self):
+        """Return the time spent in each state as a string."""
+        durations = self.get_durations()
+        return ', '.join('%s %.1fs' % (state, durations[state])
+                         for state in [PLAYING, PAUSED, RELEASED])
+
+
+def sample_to_pixbuf(sample):
+    """Return a pixbuf with the pixels of a Gst.Sample in pixbuf_caps."""
+    structure = sample.get_caps().get_structure(0)
+    width = structure.get_value('width')
+    height = structure.get_value('height')
+    buffer = sample.get_buffer()
+    pixels = buffer.extract_dup(0, buffer.get_size())
+    # GStreamer pads RGB rows to a multiple of 4 bytes.
+    rowstride = (width * 3 + 3) & ~3
+    return GdkPixbuf.Pixbuf.new_from_bytes(
+        GLib.Bytes.new(pixels), GdkPixbuf.Colorspace.RGB, False, 8,
+        width, height, rowstride)
+
+
+def get_capture_pipeline(source='v4l2src'):
+    """Return the description of a minimal capture pipeline from source to
+    an appsink named sink, which keeps only the newest frame."""
+    return ("%s ! videoconvert ! videoscale ! %s ! "
+            "appsink name=sink max-buffers=1 drop=true sync=false" %
+            (source, pixbuf_caps))
+
+
+def get_preview_pipeline(source='v4l2src', size=512, frame=None):
+    """Return the description of a preview bin from source, cropping the
+    frames to their center square and scaling them to get_output_size(),
+    ending in a leaky queue so a slow sink drops frames instead of stalling
+    the camera.
+
+    frame is the (width, height) to capture at, normally from
+    choose_format(). Without it the source picks its own size and the square
+    is scaled to size x size.
+
+    The bin contains a videorate named rate, whose max-rate limits the
+    frame rate, and a capsfilter named preview setting the size of the
+    frames sent to the sink. Photos are taken from the frames entering
+    rate, at the full size and the full frame rate."""
+    if frame is None:
+        side = size
+        description = ("%s ! videoconvert ! aspectratiocrop aspect-ratio=1/1 "
+                       "! videoscale ! video/x-raw,width=%i,height=%i,"
+                       "pixel-aspect-ratio=1/1" % (source, side, side))
+    else:
+        width, height = frame
+        side = get_output_size(width, height, size)
+        description = ("%s ! video/x-raw,width=%i,height=%i ! videoconvert ! "
+                       "%s" % (source, width, height,
+                               get_filter_description(width, height, size)))
+    return ("%s ! videorate name=rate drop-only=true ! "
+            "videoscale name=preview-scale ! "
+            "capsfilter name=preview caps=video/x-raw,width=%i,height=%i ! "
+            "queue max-size-buffers=2 leaky=downstream" %
+            (description, side, side))
+
+
+def get_preview_side(width, height, size, scale=1):
+    """Return the side of the square preview frames for a width x height
+    widget with the given scale factor: enough pixels for the square fitting
+    in the widget, rounded up to a multiple of 16, and never more than
+    size."""
+    side = min(width, height) * scale
+    side = (side + 15) // 16 * 16
+    return max(16, min(size, side))
+
+
+def capture_photo(filename, source='v4l2src', delay=1.0, size=512,
+                  timeout=10):
+    """Capture a photo from source, a GStreamer source description such as
+    'v4l2src device=/dev/video0' or 'videotestsrc', and save its center
+    square, scaled to fit within size, to filename.
+
+    Frames are read for delay seconds first, so the camera can adjust its
+    exposure. The format is JPEG for .jpg and .jpeg files, PNG otherwise.
+    Raises CaptureError if no frame arrives within timeout seconds or the
+    pipeline fails."""
+    Gst.init(None)
+    try:
+        pipeline = Gst.parse_launch(get_capture_pipeline(source))
+    except GLib.Error as error:  # pylint: disable=E0712
+        raise CaptureError(error.message)
+    sink = pipeline.get_by_name('sink')
+    bus = pipeline.get_bus()
+
+    pipeline.set_state(Gst.State.PLAYING)
+    start = time.monotonic()
+    sample = None
+    try:
+        while True:
+            message = bus.pop_filtered(Gst.MessageType.ERROR)
+            if message is not None:
+                error, debug = message.parse_error()
+                raise CaptureError(error.message)
+            pulled = sink.emit('try-pull-sample', Gst.SECOND // 10)
+            if pulled is not None:
+                sample = pulled
+            elapsed = time.monotonic() - start
+            if sample is not None and elapsed >= delay:
+                break
+            if sample is None and elapsed >= timeout:
+                raise CaptureError('No frames from %s after %is' %
+                                   (source, timeout))
+    finally:
+        pipeline.set_state(Gst.State.NULL)
+
+    image_format = 'png'
+    if os.path.splitext(filename)[1].lower() in ['.jpg', '.jpeg']:
+        image_format = 'jpeg'
+    pixbuf = pixbufs.crop_square(sample_to_pixbuf(sample))
+    try:
+        pixbufs.AvatarNormalizer(size, image_format).save(pixbuf, filename)
+    except GLib.Error as error:  # pylint: disable=E0712
+        raise CaptureError(error.message)
+    logger.debug('Captured %s from %s in %.2fs' %
+                 (filename, source, time.monotonic() - start))
@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Index of the stock faces installed on the system and by the user."""
+
+import bisect
+import logging
+import os
+import re
+
+from gi.repository import Gio, GLib, GObject  # pylint: disable=E0611
+
+logger = logging.getLogger('mugshot_lib')
+
+# Words are runs of letters and digits, so "red-panda_02.png" is found by
+# "red", "panda" or "02".
+word_pattern = re.compile(r'[^\W_]+')
+
+
+def get_faces_dirs(site_dir=None):
+    """Return the directories stock faces are read from: the per-user
+    directory, the site directory, then pixmaps/faces in each of the system
+    data directories (XDG_DATA_DIRS)."""
+    dirs = [os.path.join(GLib.get_user_data_dir(), 'pixmaps', 'faces')]
+    if site_dir:
+        dirs.append(site_dir)
+    for data_dir in GLib.get_system_data_dirs():
+        dirs.append(os.path.join(data_dir, 'pixmaps', 'faces'))
+
+    # The same directory can be listed more than once, e.g. /usr/share and
+    # /usr/share/ in XDG_DATA_DIRS.
+    found = []
+    for directory in dirs:
+        directory = os.path.realpath(directory)
+        if directory not in found:
+            found.append(directory)
+    return found
+
+
+def get_words(text):
+    """Return the lowercase words in text."""
+    return word_pattern.findall(text.lower())
+
+
+def get_face_tags(filename):
+    """Return the words a face can be found by: the words of its name. The
+    directory is left out, as the faces share it and a query matching its
+    name (e.g. "fa" for "faces") would match every face."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    return set(get_words(name))
+
+
+class FaceSearchIndex:
+
+    '''
+    Prefix search over the names and tags of the stock faces.
+
+    Each (word, face) pair is kept in one sorted list, so the faces with a
+    word starting with a prefix are a single bisected slice. Typing more of
+    the same query only narrows the previous result instead of searching
+    the whole collection again.
+    '''
+
+    def __init__(self):
+        """Initialize the FaceSearchIndex."""
+        self._entries = []
+        self._tags = {}
+        self._last_words = None
+        self._last_result = None
+
+    def __len__(self):
+        return len(self._tags)
+
+    def add(self, filename, tags=None):
+        """Add filename, found by its own words and any extra tags."""
+        if filename in self._tags:
+            self.remove(filename)
+        words = get_face_tags(filename)
+        if tags:
+            for tag in tags:
+                words.update(get_words(tag))
+        self._tags[filename] = words
+        for word in words:
+            bisect.insort(self._entries, (word, filename))
+        self._last_words = None
+
+    def extend(self, filenames):
+        """Add many faces at once, sorting the index only once."""
+        for filename in filenames:
+            if filename in self._tags:
+                self.remove(filename)
+            words = get_face_tags(filename)
+            self._tags[filename] = words
+            self._entries.extend((word, filename) for word in words)
+        self._entries.sort()
+        self._last_words = None
+
+    def remove(self, filename):
+        """Remove filename from the index."""
+        words = self._tags.pop(filename, None)
+        if words is None:
+            return
+        for word in words:
+            index = bisect.bisect_left(self._entries, (word, filename))
+            if index < len(self._entries) and \
+                    self._entries[index] == (word, filename):
+                del self._entries[index]
+        self._last_words = None
+
+    def _find_prefix(self, prefix):
+        """Return the faces with a word starting with prefix."""
+        start = bisect.bisect_left(self._entries, (prefix, ''))
+        found = set()
+        for word, filename in self._entries[start:]:
+            if not word.startswith(prefix):
+                break
+            found.add(filename)
+        return found
+
+    def _matches(self, filename, words):
+        """Return True if every word prefixes a word of filename."""
+        tags = self._tags.get(filename, ())
+        return all(any(tag.startswith(word) for tag in tags)
+                   for word in words)
+
+    def search(self, query):
+        """Return the set of faces matching every word of query, or None if
+        the query is empty (everything matches)."""
+        words = get_words(query)
+        if not words:
+            self._last_words = None
+            return None
+
+        last = self._last_words
+        if last is not None and len(words) >= len(last) and \
+                all(word.startswith(previous)
+                    for word, previous in zip(words, last)):
+            # A refinement of the previous query, filter its result.
+            result = set(filename for filename in self._last_result
+                         if self._matches(filename, words))
+        else:
+            result = None
+            for word in sorted(words, key=len, reverse=True):
+                found = self._find_prefix(word)
+                result = found if result is None else result & found
+                if not result:
+                    break
+
+        self._last_words = words
+        self._last_result = result
+        return result
+
+
+class FaceDirectoryIndex(GObject.GObject):
+
+    '''
+    The stock faces found in a list of directories.
+
+    The directories are listed once with os.scandir, then kept current with
+    a Gio.FileMonitor per directory, so faces added or removed while Mugshot
+    is running show up without rescanning. Directories that do not exist yet
+    are monitored too.
+
+    Keyword arguments:
+    - dirs: The directories to index.
+
+    Signals:
+    - face-added:   (filename) a new face was found.
+    - face-removed: (filename) a face was removed.
+    - face-changed: (filename) an existing face was modified.
+    '''
+    __gsignals__ = {
+        'face-added': (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE,
+                       (GObject.TYPE_STRING,)),
+        'face-removed': (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE,
+                         (GObject.TYPE_STRING,)),
+        'face-changed': (GObject.SIGNAL_RUN_LAST, GObject.TYPE_NONE,
+                         (GObject.TYPE_STRING,)),
+    }
+
+    def __init__(self, dirs):
+        """Initialize the FaceDirectoryIndex."""
+        GObject.GObject.__init__(self)
+        self.dirs = dirs
+        self._faces = set()
+        self._monitors = []
+
+    def __len__(self):
+        return len(self._faces)
+
+    def __contains__(self, filename):
+        return filename in self._faces
+
+    def is_empty(self):
+        """Return True if no faces were found."""
+        return not self._faces
+
+    def get_faces(self):
+        """Return the sorted list of faces."""
+        return sorted(self._faces)
+
+    def scan(self):
+        """List the faces in every directory."""
+        self._faces.clear()
+        for directory in self.dirs:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            self._faces.add(entry.path)
+            except OSError:
+                continue
+        logger.debug('Found %i stock faces in %s' %
+                     (len(self._faces), ', '.join(self.dirs)))
+
+    def monitor(self):
+        """Start following changes to the directories."""
+        if self._monitors:
+            return
+        for directory in self.dirs:
+            try:
+                monitor = Gio.File.new_for_path(directory).monitor_directory(
+                    Gio.FileMonitorFlags.WATCH_MOVES, None)
+            except GLib.Error:  # pylint: disable=E0712
+                logger.debug('Unable to monitor %s' % directory)
+                continue
+            monitor.connect('changed', self.on_monitor_changed)
+            self._monitors.append(monitor)
+
+    def stop(self):
+        """Stop following changes to the directories."""
+        for monitor in self._monitors:
+            monitor.cancel()
+        self._monitors = []
+
+    def _add(self, filename):
+        """Add filename if it is a file, emitting face-added or
+        face-changed."""
+        if not os.path.isfile(filename):
+            return
+        if filename in self._faces:
+            self.emit('face-changed', filename)
+        else:
+            self._faces.add(filename)
+            self.emit('face-added', filename)
+
+    def _remove(self, filename):
+        """Remove filename, emitting face-removed."""
+        if filename in self._faces:
+            self._faces.discard(filename)
+            self.emit('face-removed', filename)
+
+    def on_monitor_changed(self, monitor, changed, other, event):
+        """Update the index from a directory monitor event."""
+        if event in [Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+                     Gio.FileMonitorEvent.MOVED_IN]:
+            self._add(changed.get_path())
+        elif event in [Gio.FileMonitorEvent.DELETED,
+                       Gio.FileMonitorEvent.MOVED_OUT]:
+            self._remove(changed.get_path())
+        elif event == Gio.FileMonitorEvent.RENAMED:
+            self._remove(changed.get_path())
+            self._add(other.get_path())
@@ -23,7 +23,6 @@ import os
 import tempfile
 
 from . mugshotconfig import get_data_file
-from . Builder import Builder
 
 
 def get_builder(builder_file_name):
@@ -38,6 +37,9 @@ def get_builder(builder_file_name):
     if not os.path.exists(ui_filename):
         ui_filename = None
 
+    # Builder loads GTK, which set_up_logging() and the others do not need.
+    from . Builder import Builder
+
     builder = Builder()
     builder.set_translation_domain('mugshot')
     builder.add_from_file(ui_filename)
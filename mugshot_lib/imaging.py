@@ -0,0 +1,255 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cropping and resampling of images held in NumPy arrays.
+
+This module does not depend on GTK, so it can be used and tested without a
+display. Images are (height, width, channels) uint8 arrays, as returned by
+pixbufs.pixbuf_to_array(). NumPy is optional: without it, only the crop
+geometry is available and has_numpy() returns False."""
+
+import math
+import os
+
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+CROP_CENTER = 'center'
+CROP_LEFT = 'left'
+CROP_RIGHT = 'right'
+
+METHOD_BOX = 'box'
+METHOD_LANCZOS = 'lanczos'
+
+# Lobes of the Lanczos kernel.
+LANCZOS_RADIUS = 3
+
+# Output rows per strip. Strips are the same whatever the number of workers,
+# so every output row is always computed by the same operations and the
+# result does not depend on how many threads were used.
+STRIP_ROWS = 32
+
+# Smaller sources are resampled on the calling thread.
+PARALLEL_MIN_PIXELS = 4000000
+
+
+def get_workers(workers=None, pixels=None):
+    """Return the number of threads to resample with. None uses every CPU
+    for sources of at least PARALLEL_MIN_PIXELS pixels."""
+    if workers is None:
+        if pixels is not None and pixels < PARALLEL_MIN_PIXELS:
+            return 1
+        workers = os.cpu_count() or 1
+    return max(1, workers)
+
+
+def get_strips(height, rows=STRIP_ROWS):
+    """Return the (start, end) output rows of each strip."""
+    return [(start, min(start + rows, height))
+            for start in range(0, height, rows)]
+
+
+def has_numpy():
+    """Return True if NumPy is available."""
+    return numpy is not None
+
+
+def get_crop_box(width, height, style=CROP_CENTER):
+    """Return the (x, y, width, height) of the square to crop from a width x
+    height image. Portrait images are always cropped around the vertical
+    center, landscape images to the left, center or right."""
+    if width > height:
+        size = height
+        if style == CROP_LEFT:
+            x = 0
+        elif style == CROP_RIGHT:
+            x = width - size
+        else:
+            x = (width - size) // 2
+        return (x, 0, size, size)
+    size = width
+    return (0, (height - size) // 2, size, size)
+
+
+def crop(array, style=CROP_CENTER):
+    """Return a square view of array, cropped with get_crop_box()."""
+    x, y, width, height = get_crop_box(array.shape[1], array.shape[0], style)
+    return array[y:y + height, x:x + width]
+
+
+def lanczos(x):
+    """Return the Lanczos kernel evaluated at x."""
+    return numpy.where(numpy.abs(x) < LANCZOS_RADIUS,
+                       numpy.sinc(x) * numpy.sinc(x / LANCZOS_RADIUS), 0.0)
+
+
+def get_taps(in_size, out_size, method=METHOD_LANCZOS):
+    """Return the (indices, weights) resampling in_size pixels to out_size.
+
+    Both are (out_size, taps) arrays: output pixel i is the sum of the input
+    pixels indices[i] multiplied by weights[i]. When downscaling, the box
+    filter averages the exact area covered by each output pixel and the
+    Lanczos kernel is widened by the scale factor so it does not alias."""
+    scale = float(out_size) / in_size
+    positions = numpy.arange(out_size, dtype=numpy.float64)
+
+    if method == METHOD_BOX:
+        starts = positions / scale
+        ends = (positions + 1) / scale
+        taps = int(math.ceil(1 / scale)) + 1
+        indices = numpy.floor(starts).astype(numpy.intp)[:, None] + \
+            numpy.arange(taps)[None, :]
+        weights = numpy.minimum(indices + 1, ends[:, None]) - \
+            numpy.maximum(indices, starts[:, None])
+        weights = numpy.clip(weights, 0, None)
+    elif method == METHOD_LANCZOS:
+        filter_scale = min(scale, 1.0)
+        support = LANCZOS_RADIUS / filter_scale
+        centers = (positions + 0.5) / scale
+        taps = int(math.ceil(support * 2)) + 1
+        indices = numpy.floor(centers - support).astype(numpy.intp)[:, None] \
+            + numpy.arange(taps)[None, :]
+        weights = lanczos((indices + 0.5 - centers[:, None]) * filter_scale)
+    else:
+        raise ValueError('Unknown resampling method %s' % method)
+
+    # Repeat the edge pixels beyond the borders of the image.
+    weights /= weights.sum(axis=1, keepdims=True)
+    indices = numpy.clip(indices, 0, in_size - 1)
+    return (indices, weights.astype(numpy.float32))
+
+
+def resample_axis(array, indices, weights, axis):
+    """Resample array along axis (0 for rows, 1 for columns) with the taps
+    from get_taps(). Return a float32 array."""
+    shape = list(array.shape)
+    shape[axis] = indices.shape[0]
+    result = numpy.zeros(shape, dtype=numpy.float32)
+    for tap in range(indices.shape[1]):
+        tap_weights = weights[:, tap]
+        if axis == 0:
+            tap_weights = tap_weights[:, None, None]
+        else:
+            tap_weights = tap_weights[None, :, None]
+        result += numpy.take(array, indices[:, tap], axis=axis) * tap_weights
+    return result
+
+
+def to_uint8(array):
+    """Round a float array to uint8."""
+    return numpy.clip(numpy.rint(array), 0, 255).astype(numpy.uint8)
+
+
+def premultiply(array):
+    """Return an RGBA array as float32 with premultiplied alpha."""
+    alpha = array[:, :, 3:].astype(numpy.float32) / 255
+    return numpy.concatenate([array[:, :, :3] * alpha, alpha * 255], axis=2)
+
+
+def unpremultiply(array):
+    """Undo premultiply() on a float32 RGBA array."""
+    alpha = numpy.clip(array[:, :, 3:], 0, 255)
+    color = numpy.where(alpha > 0,
+                        array[:, :, :3] * 255 / numpy.maximum(alpha, 1), 0)
+    return numpy.concatenate([color, alpha], axis=2)
+
+
+def resample_strip(array, rows, columns, rows_first, start, end):
+    """Return output rows start to end of the resampled array.
+
+    Only the source rows under the taps of those output rows are read, so
+    strips can be computed independently and in any order."""
+    indices = rows[0][start:end]
+    first = int(indices.min())
+    source = array[first:int(indices.max()) + 1]
+    indices = indices - first
+    weights = rows[1][start:end]
+
+    has_alpha = source.shape[2] == 4
+    if has_alpha:
+        source = premultiply(source)
+    if rows_first:
+        result = resample_axis(source, indices, weights, 0)
+        result = resample_axis(result, columns[0], columns[1], 1)
+    else:
+        result = resample_axis(source, columns[0], columns[1], 1)
+        result = resample_axis(result, indices, weights, 0)
+    if has_alpha:
+        result = unpremultiply(result)
+    return to_uint8(result)
+
+
+def resample(array, width, height, method=METHOD_LANCZOS, workers=None):
+    """Return array resampled to width x height.
+
+    The two axes are resampled separately, in the order that does the least
+    work. RGBA images are resampled with premultiplied alpha so that
+    transparent pixels do not bleed their color into their neighbours.
+
+    The output is computed in horizontal strips of STRIP_ROWS rows, on a pool
+    of workers threads (see get_workers()). NumPy releases the GIL while it
+    works on the strips, and the result is identical for any number of
+    workers."""
+    in_height, in_width, channels = array.shape
+    if (in_width, in_height) == (width, height):
+        return array.copy()
+
+    rows = get_taps(in_height, height, method)
+    columns = get_taps(in_width, width, method)
+    rows_first = height * rows[0].shape[1] * in_width + \
+        height * width * columns[0].shape[1]
+    columns_first = in_height * width * columns[0].shape[1] + \
+        height * width * rows[0].shape[1]
+    rows_first = rows_first <= columns_first
+
+    result = numpy.empty((height, width, channels), dtype=numpy.uint8)
+
+    def run(strip):
+        start, end = strip
+        result[start:end] = resample_strip(array, rows, columns, rows_first,
+                                           start, end)
+
+    strips = get_strips(height)
+    workers = min(get_workers(workers, in_width * in_height), len(strips))
+    if workers == 1:
+        for strip in strips:
+            run(strip)
+    else:
+        with ThreadPoolExecutor(workers) as executor:
+            list(executor.map(run, strips))
+    return result
+
+
+def get_luma(array):
+    """Return the Rec. 601 luma of an RGB(A) array as float32."""
+    return (array[:, :, 0] * numpy.float32(0.299) +
+            array[:, :, 1] * numpy.float32(0.587) +
+            array[:, :, 2] * numpy.float32(0.114))
+
+
+def get_sharpness(array):
+    """Return the variance of the Laplacian of array. Blurred frames (motion,
+    focus) have fewer edges and so a lower score."""
+    luma = get_luma(array)
+    laplacian = (luma[1:-1, :-2] + luma[1:-1, 2:] + luma[:-2, 1:-1] +
+                 luma[2:, 1:-1] - 4 * luma[1:-1, 1:-1])
+    return float(laplacian.var())
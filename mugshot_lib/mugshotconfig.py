@@ -22,11 +22,15 @@ __all__ = [
     'project_path_not_found',
     'get_data_file',
     'get_data_path',
+    'get_helper_path',
 ]
 
 # Where your project will look for your data (for instance, images and ui
 # files). By default, this is ../data, relative your trunk layout
 __mugshot_data_directory__ = '../data/'
+# The privileged helper run as root, installed at a fixed path. There is none
+# when running from the source tree.
+__mugshot_helper__ = None
 __license__ = 'GPL-3+'
 __version__ = '0.4.3'
 
@@ -65,6 +69,14 @@ def get_data_path():
     return abs_data_path
 
 
+def get_helper_path():
+    """Retrieve the path of the installed privileged helper, or None
+
+    This path is specified at installation time.
+    """
+    return __mugshot_helper__
+
+
 def get_version():
     """Return the program version."""
     return __version__
@@ -0,0 +1,387 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Image loading helpers shared by the profile, stock and file previews."""
+
+import logging
+import os
+import shutil
+
+from concurrent.futures import ThreadPoolExecutor
+
+from gi.repository import GdkPixbuf, GLib  # pylint: disable=E0611
+
+from . import imaging
+
+logger = logging.getLogger('mugshot_lib')
+
+# Decode at this multiple of the requested size, then resample().
+# The loaders (libjpeg DCT scaling for JPEG) do the bulk of the reduction
+# cheaply, leaving a small high quality resample for the final step.
+OVERSAMPLE = 2
+
+# Size of the chunks fed to the PixbufLoader.
+CHUNK_SIZE = 65536
+
+
+def get_decode_size(width, height, min_side=None):
+    """Return the (width, height) to decode an image at so that its shortest
+    side is at least min_side. Images are never scaled up."""
+    shortest = min(width, height)
+    if min_side is None or shortest <= min_side:
+        return (width, height)
+    scale = float(min_side) / shortest
+    return (max(1, int(round(width * scale))),
+            max(1, int(round(height * scale))))
+
+
+def load_pixbuf(filename, min_side=None):
+    """Load filename, decoding it close to the size needed for min_side.
+
+    The image header is read first by the PixbufLoader, and the decode size is
+    set from the size-prepared signal so that the full resolution image is
+    never allocated when a smaller one will do.
+
+    Raises GLib.Error if the file cannot be decoded, or OSError if it
+    cannot be read."""
+    def on_size_prepared(loader, width, height):
+        decode_width, decode_height = get_decode_size(width, height, min_side)
+        if (decode_width, decode_height) != (width, height):
+            logger.debug('Decoding %s at %ix%i (from %ix%i)' %
+                         (filename, decode_width, decode_height,
+                          width, height))
+            loader.set_size(decode_width, decode_height)
+
+    loader = GdkPixbuf.PixbufLoader()
+    loader.connect('size-prepared', on_size_prepared)
+    try:
+        with open(filename, 'rb') as image:
+            chunk = image.read(CHUNK_SIZE)
+            while chunk:
+                loader.write(chunk)
+                chunk = image.read(CHUNK_SIZE)
+    finally:
+        loader.close()
+    return loader.get_pixbuf()
+
+
+def load_scaled(filename, width, height):
+    """Load filename and scale it to exactly width x height.
+
+    Raises GLib.Error if the file cannot be decoded, or OSError if it
+    cannot be read."""
+    pixbuf = load_pixbuf(filename, max(width, height) * OVERSAMPLE)
+    return resample(pixbuf, width, height)
+
+
+def pixbuf_to_array(pixbuf):
+    """Return the pixels of pixbuf as a (height, width, channels) uint8
+    NumPy array."""
+    width = pixbuf.get_width()
+    height = pixbuf.get_height()
+    channels = pixbuf.get_n_channels()
+    rowstride = pixbuf.get_rowstride()
+    pixels = imaging.numpy.frombuffer(pixbuf.get_pixels(),
+                                      dtype=imaging.numpy.uint8)
+    # The last row is not padded to the rowstride.
+    pixels = imaging.numpy.pad(pixels, (0, height * rowstride - len(pixels)))
+    pixels = pixels.reshape(height, rowstride)[:, :width * channels]
+    return pixels.reshape(height, width, channels)
+
+
+def array_to_pixbuf(array):
+    """Return a pixbuf with the pixels of a (height, width, channels) uint8
+    NumPy array, with 3 (RGB) or 4 (RGBA) channels."""
+    height, width, channels = array.shape
+    data = GLib.Bytes.new(imaging.numpy.ascontiguousarray(array).tobytes())
+    return GdkPixbuf.Pixbuf.new_from_bytes(data, GdkPixbuf.Colorspace.RGB,
+                                           channels == 4, 8, width, height,
+                                           width * channels)
+
+
+def crop_square(pixbuf, style=imaging.CROP_CENTER):
+    """Return a square of pixbuf, without copying its pixels. See
+    imaging.get_crop_box() for the crop styles."""
+    x, y, width, height = imaging.get_crop_box(pixbuf.get_width(),
+                                               pixbuf.get_height(), style)
+    return pixbuf.new_subpixbuf(x, y, width, height)
+
+
+def scale_strips(pixbuf, width, height, workers=None):
+    """Return pixbuf scaled to width x height with GdkPixbuf HYPER, one
+    strip of output rows per task on a pool of workers threads.
+
+    Each strip is rendered from the whole source with the same scale and
+    offset, exactly as scale_simple() would, so there are no seams and the
+    result matches scale_simple(). The GIL is released during each call."""
+    workers = imaging.get_workers(
+        workers, pixbuf.get_width() * pixbuf.get_height())
+    if workers == 1:
+        return pixbuf.scale_simple(width, height, GdkPixbuf.InterpType.HYPER)
+
+    result = GdkPixbuf.Pixbuf.new(GdkPixbuf.Colorspace.RGB,
+                                  pixbuf.get_has_alpha(), 8, width, height)
+    scale_x = float(width) / pixbuf.get_width()
+    scale_y = float(height) / pixbuf.get_height()
+
+    def run(strip):
+        start, end = strip
+        pixbuf.scale(result, 0, start, width, end - start, 0, 0,
+                     scale_x, scale_y, GdkPixbuf.InterpType.HYPER)
+
+    with ThreadPoolExecutor(workers) as executor:
+        list(executor.map(run, imaging.get_strips(height)))
+    return result
+
+
+def resample(pixbuf, width, height, method=imaging.METHOD_LANCZOS,
+             workers=None):
+    """Return pixbuf resampled to width x height, with the imaging module if
+    NumPy is available and GdkPixbuf HYPER scaling otherwise. Large images
+    are resampled in strips on every CPU unless workers is given."""
+    if not imaging.has_numpy():
+        return scale_strips(pixbuf, width, height, workers)
+    array = imaging.resample(pixbuf_to_array(pixbuf), width, height, method,
+                             workers)
+    return array_to_pixbuf(array)
+
+
+def get_writable_formats():
+    """Return the names of the image formats GdkPixbuf can save."""
+    return [image_format.get_name()
+            for image_format in GdkPixbuf.Pixbuf.get_formats()
+            if image_format.is_writable()]
+
+
+def get_save_options(image_format, png_compression=6, jpeg_quality=90,
+                     webp_quality=90):
+    """Return the GdkPixbuf save options for image_format."""
+    if image_format == 'png':
+        return {'compression': png_compression}
+    if image_format == 'jpeg':
+        return {'quality': jpeg_quality}
+    if image_format == 'webp':
+        return {'quality': webp_quality}
+    return {}
+
+
+class AvatarNormalizer:
+
+    '''
+    Normalizes profile images before they are saved, so that consumers of
+    ~/.face never have to decode more than they need.
+
+    Keyword arguments:
+    - max_size:     Maximum width and height of the saved image.
+    - image_format: GdkPixbuf format used when saving, e.g. 'png'.
+    - options:      Optional dictionary of GdkPixbuf save options.
+    '''
+
+    def __init__(self, max_size=512, image_format='png', options=None):
+        """Initialize the AvatarNormalizer."""
+        self.max_size = max_size
+        self.image_format = image_format
+        if options is None:
+            options = {}
+        self.options = options
+
+    @classmethod
+    def new_from_settings(cls, settings):
+        """Create an AvatarNormalizer configured from the Mugshot GSettings.
+        Formats without a writable GdkPixbuf loader fall back to PNG."""
+        image_format = settings['avatar-format']
+        if image_format not in get_writable_formats():
+            logger.debug('Unable to save %s images, using png.' %
+                         image_format)
+            image_format = 'png'
+        options = get_save_options(image_format,
+                                   settings['png-compression'],
+                                   settings['jpeg-quality'],
+                                   settings['webp-quality'])
+        return cls(settings['avatar-max-size'], image_format, options)
+
+    def get_decode_side(self):
+        """Return the minimum side to decode source images at."""
+        return self.max_size * OVERSAMPLE
+
+    def normalize(self, pixbuf):
+        """Return pixbuf scaled down to fit within max_size."""
+        width = pixbuf.get_width()
+        height = pixbuf.get_height()
+        if max(width, height) <= self.max_size:
+            return pixbuf
+        scale = float(self.max_size) / max(width, height)
+        width = max(1, int(round(width * scale)))
+        height = max(1, int(round(height * scale)))
+        return resample(pixbuf, width, height)
+
+    def save(self, pixbuf, filename):
+        """Normalize pixbuf and save it to filename."""
+        keys = list(self.options.keys())
+        values = [str(self.options[key]) for key in keys]
+        self.normalize(pixbuf).savev(filename, self.image_format, keys, values)
+
+
+class AvatarPyramid:
+
+    '''
+    A chain of successively halved copies of a profile image, built from a
+    single decode. Each consumer gets its size resampled from the nearest
+    larger level instead of decoding the original again.
+
+    Keyword arguments:
+    - pixbuf: The largest (source) image.
+    '''
+
+    # Stop halving below this size.
+    MIN_LEVEL_SIZE = 32
+
+    def __init__(self, pixbuf):
+        """Initialize the AvatarPyramid."""
+        self.levels = [pixbuf]
+        self._cache = {}
+
+    @classmethod
+    def new_from_file(cls, filename, max_size):
+        """Decode filename once, at no more than needed for max_size.
+
+        Raises GLib.Error if the file cannot be decoded, or OSError if it
+        cannot be read."""
+        pixbuf = load_pixbuf(filename, max_size)
+        return cls(AvatarNormalizer(max_size).normalize(pixbuf))
+
+    def get_width(self):
+        """Return the width of the source image."""
+        return self.levels[0].get_width()
+
+    def get_height(self):
+        """Return the height of the source image."""
+        return self.levels[0].get_height()
+
+    def _get_level(self, width, height):
+        """Return the smallest level at least width x height, halving the
+        previous level as needed. A 2:1 bilinear reduction averages each 2x2
+        block, so the halving itself loses no quality."""
+        level = 0
+        while True:
+            pixbuf = self.levels[level]
+            half_width = pixbuf.get_width() // 2
+            half_height = pixbuf.get_height() // 2
+            if half_width < max(width, self.MIN_LEVEL_SIZE) or \
+                    half_height < max(height, self.MIN_LEVEL_SIZE):
+                return pixbuf
+            level += 1
+            if level == len(self.levels):
+                self.levels.append(pixbuf.scale_simple(
+                    half_width, half_height, GdkPixbuf.InterpType.BILINEAR))
+
+    def get_pixbuf(self, width, height):
+        """Return the image scaled to exactly width x height."""
+        if (width, height) not in self._cache:
+            pixbuf = self._get_level(width, height)
+            if (pixbuf.get_width(), pixbuf.get_height()) != (width, height):
+                pixbuf = resample(pixbuf, width, height)
+            self._cache[(width, height)] = pixbuf
+        return self._cache[(width, height)]
+
+    def get_pixbuf_at_most(self, size):
+        """Return the image scaled down to fit within size, preserving the
+        aspect ratio. Images are never scaled up."""
+        width = self.get_width()
+        height = self.get_height()
+        if max(width, height) > size:
+            scale = float(size) / max(width, height)
+            width = max(1, int(round(width * scale)))
+            height = max(1, int(round(height * scale)))
+        return self.get_pixbuf(width, height)
+
+    def save(self, filename, size, normalizer=None):
+        """Save the image, scaled down to fit within size, to filename."""
+        if normalizer is None:
+            normalizer = AvatarNormalizer(size)
+        normalizer.save(self.get_pixbuf_at_most(size), filename)
+
+
+class AvatarImage:
+
+    '''
+    A profile image handed from the camera, the file chooser or the stock
+    browser to save_image(). The image is kept decoded, as an AvatarPyramid,
+    and only encoded when it is saved, straight to each destination. Images
+    read from a file remember it, and are saved as a copy of that file.
+
+    Keyword arguments:
+    - pyramid:  AvatarPyramid of the image.
+    - filename: Optional file the image was read from.
+    '''
+
+    def __init__(self, pyramid, filename=None):
+        """Initialize the AvatarImage."""
+        self.pyramid = pyramid
+        self.filename = filename
+
+    @classmethod
+    def new_from_file(cls, filename, max_size):
+        """Decode filename once, at no more than needed for max_size.
+
+        Raises GLib.Error if the file cannot be decoded, or OSError if it
+        cannot be read."""
+        return cls(AvatarPyramid.new_from_file(filename, max_size), filename)
+
+    @classmethod
+    def new_from_pixbuf(cls, pixbuf, normalizer):
+        """Create an image from pixbuf, normalized with normalizer. This is
+        safe to call from a worker thread."""
+        return cls(AvatarPyramid(normalizer.normalize(pixbuf)))
+
+    def get_pixbuf(self, width, height):
+        """Return the image scaled to exactly width x height."""
+        return self.pyramid.get_pixbuf(width, height)
+
+    def is_file(self, filename):
+        """Return True if the image was read from filename."""
+        if self.filename is None or not os.path.exists(filename):
+            return False
+        try:
+            return os.path.samefile(self.filename, filename)
+        except OSError:
+            return False
+
+    def save(self, filename, normalizer):
+        """Save the image to filename: a copy of the file it was read from,
+        or else encoded once with normalizer."""
+        if self.filename is not None and os.path.isfile(self.filename):
+            if not self.is_file(filename):
+                shutil.copyfile(self.filename, filename)
+            return
+        normalizer.save(self.pyramid.levels[0], filename)
+
+    def get_file_at_most(self, size):
+        """Return the file the image was read from if it already fits within
+        size, or None."""
+        if self.filename is None or not os.path.isfile(self.filename):
+            return None
+        # The pyramid may have been reduced, check the file itself.
+        info = GdkPixbuf.Pixbuf.get_file_info(self.filename)
+        if info is None or info[0] is None or max(info[1], info[2]) > size:
+            return None
+        return self.filename
+
+    def save_at_most(self, filename, size, normalizer=None):
+        """Save the image, scaled down to fit within size, to filename."""
+        self.pyramid.save(filename, size, normalizer)
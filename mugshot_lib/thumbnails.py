@@ -0,0 +1,268 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Cheap sources of preview images: the freedesktop.org thumbnail cache and
+the thumbnails embedded in EXIF data."""
+
+import hashlib
+import logging
+import os
+import struct
+
+from gi.repository import GdkPixbuf, GLib  # pylint: disable=E0611
+
+logger = logging.getLogger('mugshot_lib')
+
+# Thumbnail sizes from the freedesktop.org thumbnail specification, largest
+# first so the sharpest available thumbnail is used.
+thumbnail_flavors = ['large', 'normal']
+
+# EXIF tags for the offset and length of the IFD1 JPEG thumbnail.
+EXIF_THUMBNAIL_OFFSET = 0x0201
+EXIF_THUMBNAIL_LENGTH = 0x0202
+
+
+def get_file_uri(filename):
+    """Return the file:// URI for filename."""
+    return GLib.filename_to_uri(os.path.abspath(filename), None)
+
+
+def get_thumbnail_path(filename, flavor='normal'):
+    """Return the thumbnail cache path for filename."""
+    uri = get_file_uri(filename)
+    digest = hashlib.md5(uri.encode('utf-8')).hexdigest()
+    return os.path.join(GLib.get_user_cache_dir(), 'thumbnails', flavor,
+                        '%s.png' % digest)
+
+
+def load_cached_thumbnail(filename):
+    """Return the cached thumbnail for filename if one exists and is still
+    valid (Thumb::MTime matches the file), otherwise None."""
+    try:
+        mtime = int(os.stat(filename).st_mtime)
+    except OSError:
+        return None
+    for flavor in thumbnail_flavors:
+        thumbnail = get_thumbnail_path(filename, flavor)
+        if not os.path.isfile(thumbnail):
+            continue
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(thumbnail)
+        except GLib.Error:  # pylint: disable=E0712
+            continue
+        if pixbuf.get_option('tEXt::Thumb::MTime') == str(mtime):
+            logger.debug('Using cached thumbnail %s' % thumbnail)
+            return pixbuf
+    return None
+
+
+def get_exif_thumbnail(filename):
+    """Return the JPEG thumbnail embedded in the EXIF data of filename as
+    bytes, or None. Only the EXIF segment is read."""
+    try:
+        with open(filename, 'rb') as image:
+            if image.read(2) != b'\xff\xd8':
+                return None
+            while True:
+                marker, length = struct.unpack('>2sH', image.read(4))
+                if marker[0] != 0xff or marker[1] == 0xda:
+                    # Not a marker, or the start of the image data.
+                    return None
+                if marker[1] == 0xe1:
+                    segment = image.read(length - 2)
+                    if segment[:6] == b'Exif\x00\x00':
+                        return parse_exif_thumbnail(segment[6:])
+                else:
+                    image.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+
+def parse_exif_thumbnail(tiff):
+    """Return the IFD1 JPEG thumbnail from TIFF formatted EXIF data, or
+    None."""
+    try:
+        if tiff[:2] == b'II':
+            order = '<'
+        elif tiff[:2] == b'MM':
+            order = '>'
+        else:
+            return None
+
+        # Skip past IFD0 to get to IFD1, the thumbnail directory.
+        ifd = struct.unpack_from(order + 'I', tiff, 4)[0]
+        entries = struct.unpack_from(order + 'H', tiff, ifd)[0]
+        ifd = struct.unpack_from(order + 'I', tiff, ifd + 2 + entries * 12)[0]
+        if ifd == 0:
+            return None
+
+        offset = None
+        length = None
+        entries = struct.unpack_from(order + 'H', tiff, ifd)[0]
+        for index in range(entries):
+            tag, tag_type, count, value = \
+                struct.unpack_from(order + 'HHII', tiff, ifd + 2 + index * 12)
+            if tag_type == 3:
+                # SHORT values are left-aligned in the value field.
+                value = struct.unpack_from(order + 'H', tiff,
+                                           ifd + 2 + index * 12 + 8)[0]
+            if tag == EXIF_THUMBNAIL_OFFSET:
+                offset = value
+            elif tag == EXIF_THUMBNAIL_LENGTH:
+                length = value
+    except struct.error:
+        return None
+
+    if offset is None or not length or offset + length > len(tiff):
+        return None
+    return tiff[offset:offset + length]
+
+
+def load_exif_thumbnail(filename):
+    """Return the EXIF thumbnail of filename as a pixbuf, or None."""
+    data = get_exif_thumbnail(filename)
+    if data is None:
+        return None
+    loader = GdkPixbuf.PixbufLoader()
+    try:
+        loader.write(data)
+        loader.close()
+    except GLib.Error:  # pylint: disable=E0712
+        return None
+    logger.debug('Using EXIF thumbnail for %s' % filename)
+    return loader.get_pixbuf()
+
+
+def load_placeholder(filename):
+    """Return a quick, low quality preview of filename, or None."""
+    pixbuf = load_cached_thumbnail(filename)
+    if pixbuf is None:
+        pixbuf = load_exif_thumbnail(filename)
+    return pixbuf
+
+
+class ThumbnailCache:
+
+    '''
+    Persistent cache of fixed size thumbnails, for sizes that are not part of
+    the freedesktop.org specification.
+
+    Entries are keyed by path, mtime and size, so modified files simply miss
+    the cache. Like the specification, Thumb::URI and Thumb::MTime are stored
+    in each thumbnail and checked when it is loaded. The cache is kept to at
+    most max_entries thumbnails, evicting the least recently used ones.
+
+    Keyword arguments:
+    - size:        Width and height of the cached thumbnails.
+    - max_entries: Maximum number of thumbnails kept.
+    - directory:   Optional cache directory.
+    '''
+
+    # Check the size bound after this many new thumbnails.
+    PRUNE_INTERVAL = 64
+
+    def __init__(self, size, max_entries=4096, directory=None):
+        """Initialize the ThumbnailCache."""
+        if directory is None:
+            directory = os.path.join(GLib.get_user_cache_dir(), 'mugshot',
+                                     'thumbnails', '%ix%i' % (size, size))
+        self.size = size
+        self.max_entries = max_entries
+        self.directory = directory
+        self._stored = 0
+
+    def get_path(self, filename, stat=None):
+        """Return the cache path for filename, or None if it does not
+        exist."""
+        if stat is None:
+            try:
+                stat = os.stat(filename)
+            except OSError:
+                return None
+        key = "%s\0%i\0%i" % (os.path.abspath(filename), stat.st_mtime_ns,
+                              stat.st_size)
+        digest = hashlib.md5(key.encode('utf-8', 'surrogateescape'))
+        return os.path.join(self.directory, '%s.png' % digest.hexdigest())
+
+    def lookup(self, filename):
+        """Return the cached thumbnail for filename, or None."""
+        try:
+            stat = os.stat(filename)
+        except OSError:
+            return None
+        path = self.get_path(filename, stat)
+        if not os.path.isfile(path):
+            return None
+        try:
+            pixbuf = GdkPixbuf.Pixbuf.new_from_file(path)
+        except GLib.Error:  # pylint: disable=E0712
+            return None
+        if pixbuf.get_option('tEXt::Thumb::URI') != get_file_uri(filename) \
+                or pixbuf.get_option('tEXt::Thumb::MTime') != \
+                str(int(stat.st_mtime)):
+            return None
+        try:
+            # Mark the entry as recently used.
+            os.utime(path)
+        except OSError:
+            pass
+        return pixbuf
+
+    def store(self, filename, pixbuf):
+        """Store the thumbnail for filename."""
+        try:
+            stat = os.stat(filename)
+            os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        except OSError:
+            return
+        path = self.get_path(filename, stat)
+        # Write to a temporary file first, so a partial thumbnail is never
+        # seen by another instance.
+        temporary = "%s.%i.tmp" % (path, os.getpid())
+        try:
+            pixbuf.savev(temporary, "png",
+                         ["tEXt::Thumb::URI", "tEXt::Thumb::MTime"],
+                         [get_file_uri(filename), str(int(stat.st_mtime))])
+            os.chmod(temporary, 0o600)
+            os.replace(temporary, path)
+        except (GLib.Error, OSError):  # pylint: disable=E0712
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            return
+
+        self._stored += 1
+        if self._stored % self.PRUNE_INTERVAL == 0:
+            self.prune()
+
+    def prune(self):
+        """Remove the least recently used thumbnails beyond max_entries."""
+        try:
+            entries = [entry for entry in os.scandir(self.directory)
+                       if entry.name.endswith('.png')]
+        except OSError:
+            return
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        logger.debug('Pruned %i thumbnail(s) from %s' %
+                     (len(entries) - self.max_entries, self.directory))
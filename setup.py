@@ -17,6 +17,7 @@
 #   with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import shutil
 import sys
 import subprocess
 
@@ -29,6 +30,10 @@ except ImportError:
 assert DistUtilsExtra.auto.__version__ >= '2.18', \
     'needs DistUtilsExtra.auto >= 2.18'
 
+from setuptools import Command  # nopep8
+
+faces_dir = '/usr/share/pixmaps/faces/'
+
 
 def update_config(libdir, values={}):
     """Update the configuration file at installation time."""
@@ -127,6 +132,34 @@ def write_appdata_file(filename_in):
     subprocess.call(cmd, shell=False)
 
 
+def install_helper(target_dir):
+    """Install the privileged helper at its fixed path. It is run as root, so
+    it must not be run from the (possibly user-writable) library."""
+    if not os.path.exists(target_dir):
+        os.makedirs(target_dir)
+    helper = os.path.join(target_dir, 'mugshot-helper')
+    print(("Privileged Helper: %s" % helper))
+    shutil.copyfile(os.path.join('mugshot_lib', 'PrivilegedHelper.py'), helper)
+    os.chmod(helper, 0o755)
+
+
+def build_face_atlas(faces_dir, output_dir):
+    """Pre-render the stock faces into an atlas, for testing. Mugshot builds
+    its own in the user cache."""
+    if not os.path.isdir(faces_dir) or len(os.listdir(faces_dir)) == 0:
+        print(("No stock faces in %s, not building a face atlas." %
+               faces_dir))
+        return
+    try:
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from mugshot_lib import FaceAtlas
+        count = FaceAtlas.build_atlas(faces_dir, output_dir)
+    except Exception as error:
+        print(("WARNING: Unable to build the face atlas: %s" % error))
+        return
+    print(("Face atlas: %i faces in %s" % (count, output_dir)))
+
+
 # Update AppData with latest translations first.
 write_appdata_file("data/metainfo/mugshot.appdata.xml.in")
 
@@ -153,6 +186,9 @@ class InstallAndUpdateDataDirectory(DistUtilsExtra.auto.install_auto):
 
             data_dir = os.path.join(self.prefix, 'share', 'mugshot', '')
             script_path = os.path.join(self.prefix, 'bin')
+            target_helper = os.path.join(target_data, 'lib', 'mugshot')
+            helper_path = os.path.join(self.prefix, 'lib', 'mugshot',
+                                       'mugshot-helper')
         else:
             # --user install
             self.root = ''
@@ -167,6 +203,9 @@ class InstallAndUpdateDataDirectory(DistUtilsExtra.auto.install_auto):
 
             data_dir = target_pkgdata
             script_path = target_scripts
+            target_helper = os.path.realpath(os.path.join(target_data, 'lib',
+                                                          'mugshot'))
+            helper_path = os.path.join(target_helper, 'mugshot-helper')
 
         print(("Root: %s" % self.root))
         print(("Prefix: %s\n" % self.prefix))
@@ -177,6 +216,7 @@ class InstallAndUpdateDataDirectory(DistUtilsExtra.auto.install_auto):
         print(("Mugshot Data Directory: %s" % data_dir))
 
         values = {'__mugshot_data_directory__': "'%s'" % (data_dir),
+                  '__mugshot_helper__': "'%s'" % (helper_path),
                   '__version__': "'%s'" % self.distribution.get_version()}
         update_config(self.install_lib, values)
 
@@ -185,6 +225,31 @@ class InstallAndUpdateDataDirectory(DistUtilsExtra.auto.install_auto):
         move_icon_file(self.root, target_data)
         update_desktop_file(desktop_file, script_path)
 
+        install_helper(os.path.join(self.root, target_helper))
+
+
+class BuildFaceAtlas(Command):
+
+    """Command Class to pre-render the stock faces into an atlas."""
+
+    description = "pre-render the stock faces into an atlas for testing"
+    user_options = [
+        ('faces-dir=', None, "directory of stock faces [%s]" % faces_dir),
+        ('output-dir=', None, "directory to write the atlas to"),
+    ]
+
+    def initialize_options(self):
+        self.faces_dir = faces_dir
+        self.output_dir = None
+
+    def finalize_options(self):
+        if self.output_dir is None:
+            self.output_dir = os.path.join('build', 'face-atlas')
+
+    def run(self):
+        """Run the setup commands."""
+        build_face_atlas(self.faces_dir, self.output_dir)
+
 
 DistUtilsExtra.auto.setup(
     name='mugshot',
@@ -199,5 +264,6 @@ DistUtilsExtra.auto.setup(
     url='https://github.com/bluesabre/mugshot',
     data_files=[('share/man/man1', ['mugshot.1']),
                 ('share/metainfo/', ['data/metainfo/mugshot.appdata.xml'])],
-    cmdclass={'install': InstallAndUpdateDataDirectory}
+    cmdclass={'install': InstallAndUpdateDataDirectory,
+              'build_face_atlas': BuildFaceAtlas}
 )
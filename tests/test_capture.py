@@ -0,0 +1,61 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for mugshot_lib.capture and the --capture-camera path, which run the
+capture pipeline against videotestsrc instead of a camera."""
+
+import argparse
+
+import pytest
+
+gi = pytest.importorskip('gi')
+try:
+    gi.require_version('Gst', '1.0')
+    gi.require_version('GdkPixbuf', '2.0')
+except ValueError as error:
+    pytest.skip(str(error), allow_module_level=True)
+
+from gi.repository import GdkPixbuf  # pylint: disable=E0611  # nopep8
+
+import mugshot  # nopep8
+from mugshot_lib import capture  # nopep8
+
+# Enough frames to still be running after the delay, few enough to end soon.
+source = 'videotestsrc num-buffers=30'
+
+
+@pytest.mark.parametrize('extension', ['png', 'jpg'])
+def test_capture_photo_writes_an_image(tmp_path, extension):
+    filename = str(tmp_path / ('photo.%s' % extension))
+    capture.capture_photo(filename, source, delay=0.1, size=64)
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file(filename)
+    assert (pixbuf.get_width(), pixbuf.get_height()) == (64, 64)
+
+
+def test_capture_photo_reports_a_broken_pipeline(tmp_path):
+    with pytest.raises(capture.CaptureError):
+        capture.capture_photo(str(tmp_path / 'photo.png'), 'not-an-element',
+                              delay=0.1)
+
+
+def test_capture_camera_option(tmp_path):
+    filename = str(tmp_path / 'photo.png')
+    options = argparse.Namespace(capture_camera=filename, device=None,
+                                 delay=0.1, camera_source=source)
+    assert mugshot.capture_camera(options) == 0
+    assert GdkPixbuf.Pixbuf.new_from_file(filename).get_width() > 0
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for mugshot_lib.imaging, which runs without GTK."""
+
+import pytest
+
+from mugshot_lib import imaging
+
+numpy = pytest.importorskip('numpy')
+
+
+def make_noise(width, height, channels=3, seed=0):
+    """Return a random width x height image."""
+    generator = numpy.random.default_rng(seed)
+    return generator.integers(0, 256, (height, width, channels),
+                              dtype=numpy.uint8)
+
+
+def test_crop_box_landscape():
+    assert imaging.get_crop_box(1280, 720) == (280, 0, 720, 720)
+    assert imaging.get_crop_box(1280, 720, imaging.CROP_LEFT) == \
+        (0, 0, 720, 720)
+    assert imaging.get_crop_box(1280, 720, imaging.CROP_RIGHT) == \
+        (560, 0, 720, 720)
+
+
+def test_crop_box_portrait_ignores_style():
+    for style in [imaging.CROP_LEFT, imaging.CROP_CENTER, imaging.CROP_RIGHT]:
+        assert imaging.get_crop_box(480, 640, style) == (0, 80, 480, 480)
+
+
+def test_crop_box_square():
+    assert imaging.get_crop_box(512, 512) == (0, 0, 512, 512)
+
+
+def test_crop_is_a_view():
+    array = make_noise(40, 30)
+    cropped = imaging.crop(array)
+    assert cropped.shape == (30, 30, 3)
+    assert numpy.shares_memory(cropped, array)
+    assert numpy.array_equal(cropped, array[:, 5:35])
+
+
+@pytest.mark.parametrize('method', [imaging.METHOD_BOX,
+                                    imaging.METHOD_LANCZOS])
+@pytest.mark.parametrize('size', [(7, 5), (64, 64), (200, 150)])
+def test_resample_constant_image(method, size):
+    array = numpy.full((96, 128, 3), (10, 128, 250), dtype=numpy.uint8)
+    result = imaging.resample(array, size[0], size[1], method)
+    assert result.shape == (size[1], size[0], 3)
+    assert numpy.array_equal(result, numpy.broadcast_to(array[:1, :1],
+                                                        result.shape))
+
+
+def test_resample_constant_rgba_keeps_color():
+    array = numpy.full((64, 64, 4), (200, 100, 50, 128), dtype=numpy.uint8)
+    result = imaging.resample(array, 20, 20)
+    assert numpy.array_equal(result, numpy.broadcast_to(array[:1, :1],
+                                                        result.shape))
+
+
+def test_resample_box_averages_blocks():
+    array = make_noise(64, 48)
+    result = imaging.resample(array, 16, 12, imaging.METHOD_BOX)
+    expected = array.reshape(12, 4, 16, 4, 3).mean(axis=(1, 3))
+    assert numpy.abs(result - expected).max() <= 0.5 + 1e-3
+
+
+def test_resample_same_size_copies():
+    array = make_noise(32, 32)
+    result = imaging.resample(array, 32, 32)
+    assert numpy.array_equal(result, array)
+    assert not numpy.shares_memory(result, array)
+
+
+@pytest.mark.parametrize('method', [imaging.METHOD_BOX,
+                                    imaging.METHOD_LANCZOS])
+def test_resample_workers_give_identical_results(method):
+    # Enough output rows for several strips.
+    array = make_noise(300, 260, 4)
+    single = imaging.resample(array, 150, 130, method, workers=1)
+    for workers in [2, 3, 8]:
+        assert numpy.array_equal(
+            imaging.resample(array, 150, 130, method, workers=workers),
+            single)
+
+
+def test_resample_unknown_method():
+    with pytest.raises(ValueError):
+        imaging.resample(make_noise(8, 8), 4, 4, 'nearest')
+
+
+def test_get_workers():
+    assert imaging.get_workers(4) == 4
+    assert imaging.get_workers(0) == 1
+    assert imaging.get_workers(None, imaging.PARALLEL_MIN_PIXELS - 1) == 1
+    assert imaging.get_workers(None, imaging.PARALLEL_MIN_PIXELS) >= 1
+
+
+def test_get_strips_cover_every_row():
+    strips = imaging.get_strips(100, 32)
+    assert strips == [(0, 32), (32, 64), (64, 96), (96, 100)]
+
+
+def test_sharpness_of_flat_image_is_zero():
+    array = numpy.full((32, 32, 3), 90, dtype=numpy.uint8)
+    assert imaging.get_sharpness(array) == 0.0
+
+
+def test_sharpness_prefers_the_sharper_image():
+    sharp = numpy.zeros((64, 64, 3), dtype=numpy.uint8)
+    sharp[::2, :] = 255
+    blurred = imaging.resample(imaging.resample(sharp, 16, 16), 64, 64)
+    assert imaging.get_sharpness(sharp) > imaging.get_sharpness(blurred) > 0
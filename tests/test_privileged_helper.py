@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+# -*- Mode: Python; coding: utf-8; indent-tabs-mode: nil; tab-width: 4 -*-
+#   Mugshot - Lightweight user configuration utility
+#   Copyright (C) 2013-2020 Sean Davis <sean@bluesabre.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License as published by
+#   the Free Software Foundation, either version 3 of the License, or
+#   (at your option) any later version.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for mugshot_lib.PrivilegedHelper in mock mode, which runs the
+helper unprivileged and without executing chfn."""
+
+import getpass
+import os
+
+import pytest
+
+from mugshot_lib import PrivilegedHelper
+
+pytest.importorskip('pexpect')
+
+# serve() only lets the user that invoked sudo edit themselves.
+username = os.environ.get('SUDO_USER', getpass.getuser())
+
+
+def test_apply_edits_mock_only_accepts_root_fields():
+    results = PrivilegedHelper.apply_edits(
+        username, {'full_name': 'Jane Doe', 'home_phone': '555',
+                   'unknown': 'value'}, mock=True)
+    assert results == {'full_name': True, 'home_phone': False,
+                       'unknown': False}
+
+
+def test_apply_edits_rejects_non_string_values():
+    results = PrivilegedHelper.apply_edits(username, {'full_name': None},
+                                           mock=True)
+    assert results == {'full_name': False}
+
+
+def test_mock_helper_round_trip():
+    helper = PrivilegedHelper.PrivilegedHelper(username, mock=True)
+    assert helper.start()
+    socket_dir = helper._socket_dir
+    try:
+        assert helper.apply({'full_name': 'Jane Doe'}) == {'full_name': True}
+        assert helper.apply({'office_phone': '555'}) == \
+            {'office_phone': False}
+    finally:
+        helper.stop()
+    assert not os.path.exists(socket_dir)
+
+
+def test_start_without_session_fails():
+    helper = PrivilegedHelper.PrivilegedHelper(username)
+    assert not helper.start()
+
+
+def test_is_trusted(tmp_path):
+    path = tmp_path / 'mugshot-helper'
+    assert not PrivilegedHelper.is_trusted(str(path))
+    path.write_text('')
+    os.chmod(str(tmp_path), 0o755)
+    os.chmod(str(path), 0o755)
+    assert PrivilegedHelper.is_trusted(str(path)) == (os.getuid() == 0)
+    os.chmod(str(path), 0o777)
+    assert not PrivilegedHelper.is_trusted(str(path))
+
+
+def test_create_socket_refuses_existing_path(tmp_path):
+    os.chmod(str(tmp_path), 0o700)
+    target = tmp_path / 'target'
+    target.write_text('')
+    path = tmp_path / 'helper'
+    path.symlink_to(target)
+    assert PrivilegedHelper.create_socket(str(path), os.getuid()) == \
+        (None, None)
+    assert path.is_symlink()
+
+
+def test_create_socket_refuses_shared_directory(tmp_path):
+    os.chmod(str(tmp_path), 0o777)
+    path = tmp_path / 'helper'
+    assert PrivilegedHelper.create_socket(str(path), os.getuid()) == \
+        (None, None)
+    assert not os.path.lexists(str(path))